@@ -0,0 +1,208 @@
+# Benchmark the Solaris batch export on a synthetic experiment
+# Read/write files and directories
+import os
+# Read command line arguments
+import argparse
+# Read/write JSON file format
+import json
+# Temporary experiment and output directories
+import tempfile
+import shutil
+# Run every scenario in a fresh process
+import subprocess
+import sys
+# Timers
+import time
+
+# Peak memory use is only available on Unix systems
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Export paths that are measured
+# - group: experiment with a groups.svd file
+# - no_group: the same experiment without groups.svd
+# - lctf: only the LCTF channels of the Unmixed snapshots
+# - no_write: read and reconstruct the images without writing (--write False)
+scenarios = {
+    'group': {'experiment': 'group', 'write_files': True, 'lctf_only': False},
+    'no_group': {'experiment': 'no_group', 'write_files': True, 'lctf_only': False},
+    'lctf': {'experiment': 'group', 'write_files': True, 'lctf_only': True},
+    'no_write': {'experiment': 'group', 'write_files': False, 'lctf_only': False}
+}
+
+# Boolean options, as on the command line of the export
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError('Boolean value expected.')
+
+# Peak resident memory of this process and its worker processes in MB
+# On Linux a new process starts with the peak memory of its parent, so the
+# main process only starts other processes and does not import numpy or the
+# export: the synthetic experiment is generated and every scenario is run
+# in its own process
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return peak_rss / 1e6
+    return peak_rss * 1024 / 1e6
+
+# Run one scenario in this process and return its measurements
+def run_scenario(scenario, experiment_dir, output_dir, workers=1, pool_type='process',
+                 image_writer='native', stack_pages=False, compression=None, write_previews=True):
+    # The batch export, only imported by the process of the scenario
+    import solaris_export
+    # Settings of the export, as set by its command line
+    config = solaris_export.ExportConfig(write_files=scenario['write_files'], image_writer=image_writer,
+                                         stack_pages=stack_pages, compression=compression,
+                                         write_previews=write_previews)
+
+    # Wall time of indexing and export, and the time of each
+    # export stage (summed over workers) from the export statistics
+    stages = {}
+    export_stats = solaris_export.new_export_stats()
+    start_time = time.perf_counter()
+    index = solaris_export.build_experiment_index(experiment_dir, stats=export_stats, config=config)
+    stages['index'] = time.perf_counter() - start_time
+
+    stage_time = time.perf_counter()
+    file_records = solaris_export.query_index(index)
+    if scenario['lctf_only']:
+        file_records = [record for record in file_records if record['lctf_channel'] is not None]
+    _, export_errors = solaris_export.export_experiment(file_records, output_dir, workers, pool_type,
+                                                        keep_images=False, stats=export_stats, config=config)
+    if config.write_files and config.write_previews:
+        # Contact sheets, as written by the command line after the export
+        preview_start_time = time.perf_counter()
+        solaris_export.write_index_contact_sheets(output_dir, index, file_records)
+        solaris_export.add_stage_time(export_stats, 'preview', preview_start_time)
+    stages['export'] = time.perf_counter() - stage_time
+    total_seconds = time.perf_counter() - start_time
+    stages.update(solaris_export.export_report(export_stats, total_seconds, export_errors)['stages'])
+
+    input_bytes = sum(record['size'] for record in file_records)
+    return {
+        'files': len(file_records),
+        'bytes': input_bytes,
+        'errors': len(export_errors),
+        'seconds': total_seconds,
+        'files_per_second': len(file_records) / total_seconds,
+        'mb_per_second': input_bytes / 1e6 / total_seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages
+    }
+
+# Run one scenario in a new process, so the peak memory of one
+# scenario does not include the others. Returns its measurements
+def run_scenario_process(scenario_name, experiment_dir, output_dir, args):
+    result_file = os.path.join(output_dir, 'result.json')
+    export_dir = os.path.join(output_dir, 'export')
+    os.makedirs(export_dir)
+    command = [sys.executable, os.path.abspath(__file__), '--scenario', scenario_name,
+               '--experiment_dir', experiment_dir, '--output_dir', export_dir, '--result', result_file,
+               '--workers', str(args.workers), '--pool', args.pool_type, '--writer', args.image_writer,
+               '--stack', str(args.stack_pages), '--compress', args.compression,
+               '--previews', str(args.write_previews)]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(result_file) as data_file:
+        return json.load(data_file)
+
+
+# ********************** MAIN function ********************** #
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark the Solaris batch export on a synthetic experiment.')
+    parser.add_argument('--groups', dest='groups', type=int, default=1,
+        help='Number of groups. Default: 1')
+    parser.add_argument('--timepoints', dest='timepoints', type=int, default=2,
+        help='Number of time points per group. Default: 2')
+    parser.add_argument('--snapshots', dest='snapshots', type=int, default=2,
+        help='Number of snapshots per time point. Default: 2')
+    parser.add_argument('--unmixed', dest='unmixed_snapshots', type=int, default=1,
+        help='Number of Unmixed (LCTF) snapshots per time point. Default: 1')
+    parser.add_argument('--size', dest='image_sizes', type=int, nargs='+', default=[1024],
+        help='Image size(s) of the synthetic experiment. Default: 1024')
+    parser.add_argument('--scenarios', dest='scenario_names', type=str, nargs='+', default=sorted(scenarios),
+        choices=sorted(scenarios), help='Scenarios to run. Default: all')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+        help='Runs of each scenario, the fastest run is reported. Default: 3')
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+        help='Number of export workers. Default: 1')
+    parser.add_argument('--pool', dest='pool_type', type=str, default='process', choices=['process', 'thread'],
+        help='Type of worker pool. Default: process')
+    parser.add_argument('--writer', dest='image_writer', type=str, default='native',
+        choices=['native', 'skimage'], help='TIFF writer. Default: native')
+    parser.add_argument('--stack', dest='stack_pages', type=str2bool, default=False,
+        help='Write LCTF snapshots as multi-page TIFFs. Default: False')
+    parser.add_argument('--compress', dest='compression', type=str, default='none', choices=['none', 'deflate'],
+        help='Lossless compression of the TIFF files. Default: none')
+    parser.add_argument('--previews', dest='write_previews', type=str2bool, default=True,
+        help='Write previews and contact sheets, as the export does by default. Default: True')
+    parser.add_argument('--directory', dest='work_dir', type=str, default=None,
+        help='Directory for the synthetic experiment and the output. Default: a temporary directory')
+    parser.add_argument('--json', dest='json_file', type=str, default=None,
+        help='Write the report to this JSON file. Default: print it')
+    # Used internally to run a single scenario in its own process
+    parser.add_argument('--scenario', dest='scenario', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--experiment_dir', dest='experiment_dir', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--output_dir', dest='output_dir', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result', dest='result_file', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        result = run_scenario(scenarios[args.scenario], args.experiment_dir, args.output_dir,
+                              args.workers, args.pool_type, args.image_writer, args.stack_pages,
+                              None if args.compression == 'none' else args.compression, args.write_previews)
+        with open(args.result_file, 'w') as data_file:
+            json.dump(result, data_file)
+        raise SystemExit(0)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='solaris_benchmark_')
+    try:
+        # The same experiment with and without a groups.svd file
+        experiment_dirs = {}
+        for experiment_name, groups in [('group', args.groups), ('no_group', 0)]:
+            experiment_dirs[experiment_name] = os.path.join(work_dir, experiment_name)
+            subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'synthetic_experiment.py'),
+                            experiment_dirs[experiment_name], '--groups', str(groups),
+                            '--timepoints', str(args.timepoints), '--snapshots', str(args.snapshots),
+                            '--unmixed', str(args.unmixed_snapshots), '--size'] +
+                           [str(image_size) for image_size in args.image_sizes],
+                           check=True, stdout=subprocess.DEVNULL)
+
+        report = {
+            'settings': {key: value for key, value in vars(args).items()
+                         if key not in ('scenario', 'experiment_dir', 'output_dir', 'result_file')},
+            'scenarios': {}
+        }
+        for scenario_name in args.scenario_names:
+            runs = []
+            for run_num in range(args.repeat):
+                run_dir = os.path.join(work_dir, 'run_{}_{}'.format(scenario_name, run_num))
+                runs.append(run_scenario_process(scenario_name,
+                                                 experiment_dirs[scenarios[scenario_name]['experiment']],
+                                                 run_dir, args))
+                shutil.rmtree(run_dir)
+            # Report the fastest run and the time of every run
+            result = min(runs, key=lambda run: run['seconds'])
+            result['runs'] = [run['seconds'] for run in runs]
+            report['scenarios'][scenario_name] = result
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    if args.json_file is None:
+        print(json.dumps(report, indent=1, sort_keys=True))
+    else:
+        with open(args.json_file, 'w') as data_file:
+            json.dump(report, data_file, indent=1, sort_keys=True)
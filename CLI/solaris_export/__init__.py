@@ -0,0 +1,26 @@
+# Export Solaris images to TIFF files
+# The package can be used from other code (or the Notebook), for example:
+#   config = ExportConfig(stack_pages=True)
+#   index = build_experiment_index(input_dir, config=config)
+#   export_experiment(query_index(index, channel='800'), output_dir, config=config)
+# skimage is only imported by the features that use it
+from .config import (ExportConfig, LCTF_channels, channels, image_bands, image_dtypes, image_sizes, image_types,
+                     infer_image_size, lctf_bands)
+from .stats import (add_stage_time, export_report, export_stages, format_seconds, merge_export_stats,
+                    new_export_stats, print_progress)
+from .index import (build_experiment_index, find_experiments, image_output_name, index_errors, index_file_name,
+                    index_records, load_experiment_index, query_index, record_output_name, safe_file_name,
+                    save_experiment_index)
+from .reader import iter_image_records, iter_solaris_images, read_solaris_image_set
+from .tiff import image_writers, write_tiff_native, write_tiff_skimage
+from .previews import read_png, write_contact_sheets, write_image_previews, write_index_contact_sheets, write_png
+from .manifest import (checksum_file_name, load_export_manifest, manifest_file_name, prune_export_manifest,
+                       save_export_manifest, save_output_checksums, verify_export)
+from .quantify import (load_quantification_rules, load_quantification_table, manifest_quantification_rows,
+                       quantification_file_name, quantify_images, save_quantification_table)
+from .unmix import load_unmixing_spectra, unmix_cube
+from .export import (create_export_executor, expand_stack_records, export_experiment, export_experiments,
+                     export_snapshot_directory, list_snapshot_jobs, plan_export, print_export_plan, run_experiment_jobs,
+                     run_export_jobs, stack_output_key)
+from .watch import watch_experiment
+from .cli import main
@@ -0,0 +1,294 @@
+# Command line of the Solaris batch export
+# Read/write files and directories
+import os
+# Read command line arguments
+import argparse
+# Write the report in JSON file format
+import json
+# Dates of --since, stage timers
+import time
+from .config import ExportConfig, image_sizes
+from .export import expand_stack_records, export_experiments, plan_export, plan_throughput, print_export_plan
+from .index import find_experiments, index_errors, index_file_name, load_experiment_index, query_index
+from .manifest import (load_export_manifest, prune_export_manifest, save_export_manifest, save_output_checksums,
+                       verify_export)
+from .previews import write_index_contact_sheets
+from .quantify import (load_quantification_rules, load_quantification_table, manifest_quantification_rows,
+                       quantification_file_name, save_quantification_table)
+from .stats import add_stage_time, export_report, format_seconds, new_export_stats
+from .tiff import image_writers
+from .unmix import load_unmixing_spectra
+from .watch import watch_experiment
+
+
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError('Boolean value expected.')
+
+# Local midnight of a YYYY-MM-DD date as a time stamp
+def str2date(v):
+    try:
+        return time.mktime(time.strptime(v, '%Y-%m-%d'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('Date expected as YYYY-MM-DD.')
+
+# Command line of the batch export. input_root_dir and output_root_dir are
+# the default directories of the experiments and of the exported experiments
+# argv is the list of arguments, by default those of the command line
+def main(input_root_dir, output_root_dir, argv=None):
+    parser = argparse.ArgumentParser(description='Batch process Solaris images.')
+    parser.add_argument('experiments', type=str, nargs='*',
+        help='The directories of the experiments to batch convert (in quotes if spaces). '
+             'Glob patterns such as "OVCAR*" select all matching experiments')
+    parser.add_argument('--since', dest='since', type=str2date, default=None,
+        help='Only export experiments modified since this date (YYYY-MM-DD). '
+             'Without experiment names all experiments are checked')
+    parser.add_argument('--input_root', dest='input_root_dir', type=str, default=input_root_dir,
+        help='Directory with the experiments. Default: {}'.format(input_root_dir))
+    parser.add_argument('--output_root', dest='output_root_dir', type=str, default=output_root_dir,
+        help='Directory for the exported experiments. Default: {}'.format(output_root_dir))
+    parser.add_argument('--size', dest='im_size', type=int, default=None, choices=image_sizes,
+        help='image dimension: 1024, 512 or 256. Default: found from the size of each file')
+    parser.add_argument('--search_file', dest='search_term', type=str, default='Snapshot',
+        help='File search term. Default: \'Snapshot\'')
+    parser.add_argument('--write', dest='write_files', type=str2bool, default=True,
+        help='Write output files. Default: True')
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+        help='Number of snapshot directories exported in parallel. Default: 1')
+    parser.add_argument('--incremental', dest='incremental', type=str2bool, default=True,
+        help='Skip files that did not change since the last export. Default: True')
+    parser.add_argument('--hash', dest='use_hash', type=str2bool, default=False,
+        help='Store content hashes in the manifest and compare them when only the time stamp changed. Default: False')
+    parser.add_argument('--reindex', dest='reindex', type=str2bool, default=False,
+        help='Index the whole experiment again instead of updating the cached index. Default: False')
+    parser.add_argument('--group', dest='group', type=str, default=None,
+        help='Only export images of this group')
+    parser.add_argument('--timepoint', dest='time_point', type=str, default=None,
+        help='Only export images of this time point')
+    parser.add_argument('--channel', dest='channel', type=str, default=None,
+        help='Only export images of this channel, e.g. 800 or LCTF channel 520')
+    parser.add_argument('--field', dest='field_name', type=str, default=None, choices=['ssa', 'ssr'],
+        help='Only export this image type: ssa (Monochrome) or ssr (RGB)')
+    parser.add_argument('--list', dest='list_files', type=str2bool, default=False,
+        help='List the selected images from the index without exporting. Default: False')
+    parser.add_argument('--plan', dest='plan', type=str2bool, default=False,
+        help='Only report file counts, sizes, geometries and estimated time of the export. Default: False')
+    parser.add_argument('--throughput', dest='throughput', type=float, default=plan_throughput,
+        help='Export throughput in MB/s used to estimate the time of --plan. Default: {}'.format(plan_throughput))
+    parser.add_argument('--writer', dest='image_writer', type=str, default='native', choices=sorted(image_writers),
+        help='TIFF writer: native (built-in baseline TIFF) or skimage. Default: native')
+    parser.add_argument('--compress', dest='compression', type=str, default='none', choices=['none', 'deflate'],
+        help='Lossless compression of the TIFF files: none or deflate (with the horizontal predictor). '
+             'Default: none')
+    parser.add_argument('--compress_level', dest='compression_level', type=int, default=1, choices=range(1, 10),
+        metavar='1-9', help='zlib level of --compress deflate. Default: 1')
+    parser.add_argument('--verify', dest='verify', type=str2bool, default=False,
+        help='Only check the output files against the checksums in the manifest and the source files. '
+             'Default: False')
+    parser.add_argument('--stack', dest='stack_pages', type=str2bool, default=False,
+        help='Write all LCTF channels of a snapshot as one multi-page TIFF per image type. Default: False')
+    parser.add_argument('--progress', dest='progress', type=str2bool, default=True,
+        help='Show a progress line with files done, MB/s and time left. Default: True')
+    parser.add_argument('--verbose', dest='verbose', type=str2bool, default=False,
+        help='Print every file that is read. Default: False')
+    parser.add_argument('--report', dest='report_file', type=str, default=None,
+        help='JSON file for the end of run report with the time of each stage. '
+             'Default: solaris_export_report.json in the output directory')
+    parser.add_argument('--pool', dest='pool_type', type=str, default='process', choices=['process', 'thread'],
+        help='Type of worker pool used when --workers is more than 1. Default: process')
+    parser.add_argument('--quantify', dest='quantify_file', type=str, default=None,
+        help='JSON file with ROIs and threshold rules. Measure the ssa images and write '
+             '{} to the output directory'.format(quantification_file_name))
+    parser.add_argument('--cube', dest='write_cubes', type=str2bool, default=False,
+        help='Write the ssa images of the LCTF bands (520 to 620) of each snapshot as one multi-page cube. '
+             'Default: False')
+    parser.add_argument('--unmix', dest='unmix_file', type=str, default=None,
+        help='JSON file with endmember spectra. Unmix every LCTF cube and write one abundance map per endmember')
+    parser.add_argument('--previews', dest='write_previews', type=str2bool, default=True,
+        help='Write 512, 256 and 128 pixel previews and a contact sheet per time point. Default: True')
+    parser.add_argument('--watch', dest='watch', type=str2bool, default=False,
+        help='Keep running and export new snapshots as soon as they are complete. Default: False')
+    parser.add_argument('--interval', dest='interval', type=float, default=5.0,
+        help='Seconds between two checks of the experiment directory with --watch. Default: 5')
+    args = parser.parse_args(argv)
+
+    input_root_dir = args.input_root_dir
+    output_root_dir = args.output_root_dir
+    if not args.experiments and args.since is None:
+        parser.error('give at least one experiment, a pattern such as "*" or --since')
+    if args.compression != 'none' and args.image_writer != 'native':
+        parser.error('--compress needs --writer native')
+
+    # Endmember spectra of the unmixing, unmixing needs the cubes
+    unmixing = None
+    if args.unmix_file is not None:
+        try:
+            unmixing = load_unmixing_spectra(args.unmix_file)
+        except (OSError, ValueError) as error:
+            parser.error('--unmix {}: {}'.format(args.unmix_file, error))
+
+    # Settings of the export
+    config = ExportConfig(image_size=args.im_size, search_term=args.search_term, write_files=args.write_files,
+                          image_writer=args.image_writer, stack_pages=args.stack_pages,
+                          write_cubes=args.write_cubes or unmixing is not None, unmixing=unmixing,
+                          write_previews=args.write_previews, verbose=args.verbose,
+                          compression=None if args.compression == 'none' else args.compression,
+                          compression_level=args.compression_level)
+
+    # Regions and thresholds of the quantification
+    quantification_rules = None
+    if args.quantify_file is not None:
+        try:
+            quantification_rules = load_quantification_rules(args.quantify_file)
+        except (OSError, ValueError) as error:
+            parser.error('--quantify {}: {}'.format(args.quantify_file, error))
+
+    experiment_names = find_experiments(input_root_dir, args.experiments, args.since)
+    if not experiment_names:
+        parser.error('no experiment in {} matches {}'.format(input_root_dir, ' '.join(args.experiments) or '--since'))
+    if args.watch and len(experiment_names) > 1:
+        parser.error('--watch takes a single experiment, {} match'.format(len(experiment_names)))
+
+    if args.verify:
+        # Check archived exports against the manifest, without exporting
+        verify_errors = []
+        for experiment_name in experiment_names:
+            checked_files, errors = verify_export(os.path.join(output_root_dir, experiment_name))
+            print('{}: verified {} output file(s), {} error(s)'.format(experiment_name, checked_files, len(errors)))
+            verify_errors.extend(errors)
+        if verify_errors:
+            print('{} file(s) could not be verified:'.format(len(verify_errors)))
+            for error_file, error_message in verify_errors:
+                print('\t{}\n\t\t{}'.format(error_file, error_message))
+            raise SystemExit(1)
+        return
+
+    # Index the experiments (groups, time points, snapshots and image files)
+    # The index is cached in the output directory and only the
+    # time points that changed are listed again
+    export_stats = new_export_stats()
+    start_time = time.perf_counter()
+    experiments = []
+    for experiment_name in experiment_names:
+        input_dir = os.path.join(input_root_dir, experiment_name)
+        output_dir = os.path.join(output_root_dir, experiment_name)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        index = load_experiment_index(input_dir, os.path.join(output_dir, index_file_name), args.reindex,
+                                      export_stats, config)
+        file_records = query_index(index, args.group, args.time_point, args.channel, args.field_name)
+        # Stacks and cubes are written with all their pages
+        file_records = expand_stack_records(file_records, query_index(index), config)
+        print('{}: indexed {} time point(s), selected {} image file(s)'.format(
+            experiment_name, len(index['timepoints']), len(file_records)))
+        experiments.append({'name': experiment_name, 'input_dir': input_dir, 'output_dir': output_dir,
+                            'index': index, 'file_records': file_records, 'manifest': None,
+                            'quantification': None})
+        if quantification_rules is not None:
+            experiments[-1]['quantification'] = {'rules': quantification_rules, 'rows': []}
+
+    if args.list_files:
+        for experiment in experiments:
+            for record in experiment['file_records']:
+                print('\t'.join([experiment['name'], str(record['group']), record['time_point'],
+                                 record['snapshot_dir'], str(record['lctf_channel'] or record['channel_name']),
+                                 record['field_name'], str(record['size']), record['path']]))
+        return
+
+    if args.plan:
+        print_export_plan(plan_export([record for experiment in experiments for record in experiment['file_records']],
+                                      args.throughput, config), args.throughput)
+        return
+
+    # The manifest of the previous export is only used when writing files
+    # Files are exported and measured again when the quantification rules change
+    # Without --incremental the selected files are exported again, but the
+    # manifest still records them with the checksums of their output files
+    if config.write_files:
+        manifest_settings = config.manifest_settings()
+        if quantification_rules is not None:
+            manifest_settings['quantify'] = quantification_rules
+        for experiment in experiments:
+            experiment['manifest'] = load_export_manifest(experiment['output_dir'], manifest_settings)
+            prune_export_manifest(experiment['manifest'], query_index(experiment['index']))
+            if not args.incremental and not args.watch:
+                selected_files = set(record['path'] for record in experiment['file_records'])
+                experiment['manifest']['files'] = dict(
+                    (source_file, entry) for source_file, entry in experiment['manifest']['files'].items()
+                    if source_file not in selected_files)
+
+    if args.watch:
+        # The manifest keeps track of the snapshots that were exported
+        experiment = experiments[0]
+        if experiment['manifest'] is None:
+            parser.error('--watch requires --write True')
+        watch_experiment(experiment['input_dir'], experiment['output_dir'], experiment['index'],
+                         experiment['manifest'],
+                         {'group': args.group, 'time_point': args.time_point, 'channel': args.channel,
+                          'field_name': args.field_name},
+                         args.interval, args.workers, args.pool_type, args.use_hash, args.progress,
+                         quantification_rules, config)
+        return
+
+    # The jobs of all experiments are run by one pool
+    output_images, export_errors = export_experiments(
+        [(experiment['file_records'], experiment['output_dir'], experiment['manifest'], experiment['quantification'])
+         for experiment in experiments],
+        args.workers, args.pool_type, keep_images=False, use_hash=args.use_hash, stats=export_stats,
+        progress=args.progress, config=config)
+    if config.write_files and config.write_previews:
+        # Contact sheets need the thumbnails of all snapshots of a time point,
+        # also of the snapshots that were not selected or not exported again
+        preview_start_time = time.perf_counter()
+        for experiment in experiments:
+            write_index_contact_sheets(experiment['output_dir'], experiment['index'], experiment['file_records'])
+        add_stage_time(export_stats, 'preview', preview_start_time)
+    # Snapshots without metadata or missing time points could not be indexed
+    export_errors = [index_error for experiment in experiments
+                     for index_error in index_errors(experiment['index'])] + export_errors
+
+    # Report the time and throughput of each stage. The report of
+    # several experiments is written to the output root directory
+    report = export_report(export_stats, time.perf_counter() - start_time, export_errors)
+    report['experiments'] = experiment_names
+    if len(experiments) == 1:
+        report_dir = experiments[0]['output_dir']
+    else:
+        report_dir = output_root_dir
+    report_file = args.report_file or os.path.join(report_dir, 'solaris_export_report.json')
+    with open(report_file, 'w') as data_file:
+        json.dump(report, data_file, indent=1, sort_keys=True)
+    print('Exported {} file(s), {:.1f} MB of {} experiment(s) in {} ({} skipped, {} error(s))'.format(
+        report['files'], report['bytes'] / 1e6, len(experiments), format_seconds(report['seconds']),
+        report['skipped_files'], report['errors']))
+
+    for experiment in experiments:
+        if experiment['manifest'] is not None:
+            save_export_manifest(experiment['output_dir'], experiment['manifest'])
+            save_output_checksums(experiment['output_dir'], experiment['manifest'])
+        if experiment['quantification'] is not None:
+            if experiment['manifest'] is not None:
+                # The table lists the measurements of all exported files, also
+                # of the files that were not selected in this run
+                save_quantification_table(experiment['output_dir'],
+                                          manifest_quantification_rows(experiment['manifest']))
+            else:
+                # Without a manifest the rows of the files measured in this
+                # run replace their rows in the previous table
+                selected_files = set(record['path'] for record in experiment['file_records'])
+                save_quantification_table(experiment['output_dir'],
+                                          [row for row in load_quantification_table(experiment['output_dir'])
+                                           if row['source_file'] not in selected_files] +
+                                          experiment['quantification']['rows'])
+
+    # Report the files that could not be exported at the end of the run
+    if export_errors:
+        print('{} file(s) could not be exported:'.format(len(export_errors)))
+        for error_file, error_message in export_errors:
+            print('\t{}\n\t\t{}'.format(error_file, error_message))
+        raise SystemExit(1)
+
@@ -0,0 +1,128 @@
+# Solaris file formats and the settings of an export
+# Numeric Python
+import numpy
+
+
+# Metadata files specify which channels were used for imaging
+# This dictionary is used to conver the channel number to 
+# a readable format used in the file naming
+channels = {
+    '1': '470',
+    '2': '660',
+    '3': '750',
+    '4': '800',
+    '5': 'ChannelError'
+}
+# The file extensions indicate which type of file
+# This dictionary is used in the file naming
+image_types = {
+    'ssr': 'RGB',
+    'ssa': 'Monochrome',
+    'ssm': 'Side-by-Side'
+}
+# The Solaris allows three different image sizes
+image_sizes = [1024, 512, 256]
+# Each file type is stored with its own pixel type
+# - ssr is an 8-bit color image (R G B)
+# - ssa is a 16-bit monochrome fluorescent image
+# - ssm is dummy image to place ssr and ssa next to each other
+image_dtypes = {
+    'ssr': 'uint8',
+    'ssa': 'uint16',
+    'ssm': 'uint16'
+}
+image_bands = {
+    'ssr': 3,
+    'ssa': 1,
+    'ssm': 1
+}
+# In an advanced mode the user can acquire images using a 
+# Liquid Crystal Tunable Filter
+# In this mode an image is acquired with the following emission filters
+# Traget, Tissue, and Food are computed by the unmixing algorithm on the system
+LCTF_channels = ['520',
+                '530',
+                '540',
+                '550',
+                '560',
+                '570',
+                '580',
+                '590',
+                '600',
+                '610',
+                '620',
+                'Target',
+                'Tissue',
+                'Food']
+
+# Find the image dimension of a file from its type and byte size
+# Returns None if the size matches no valid Solaris geometry
+def infer_image_size(field_name, byte_size):
+    if field_name not in image_dtypes:
+        return None
+    pixel_bytes = numpy.dtype(image_dtypes[field_name]).itemsize * image_bands[field_name]
+    for image_size in image_sizes:
+        if byte_size == image_size * image_size * pixel_bytes:
+            return image_size
+    return None
+
+# Emission bands of the LCTF (520 to 620 nm). The other LCTF channels
+# (Target, Tissue, Food) are the unmixed images of the Solaris software
+lctf_bands = [lctf_channel for lctf_channel in LCTF_channels if lctf_channel.isdigit()]
+
+# Settings of an export. Every function that depends on them takes the
+# configuration as an argument, so they can be called from other code
+# (or the Notebook) with different settings in the same process.
+# The configuration is sent to the worker processes with each job
+class ExportConfig(object):
+    def __init__(self, image_size=None, search_term='Snapshot', write_files=True, image_writer='native',
+                 stack_pages=False, write_cubes=False, unmixing=None, write_previews=True, verbose=False,
+                 compression=None, compression_level=1, compression_threads=None):
+        # The Solaris allows three different image sizes.
+        # None to find the size of each image from its file size
+        self.image_size = image_size
+        # The code assumes all image files have the
+        # search_term in the file name
+        self.search_term = search_term
+        # If testing, write_files can be set to False
+        # This will be slightly faster becasue it does not
+        # write to disk
+        self.write_files = write_files
+        # Output images are written by one of the image_writers
+        self.image_writer = image_writer
+        # Write all LCTF channels of a snapshot into one multi-page TIFF per image type
+        self.stack_pages = stack_pages
+        # Write the ssa images of the bands of each LCTF snapshot as one
+        # multi-page cube (bands, rows, columns) instead of one file per band
+        self.write_cubes = write_cubes
+        # Endmember spectra used to unmix the cubes (from load_unmixing_spectra),
+        # None to not unmix. Unmixing needs the cubes
+        self.unmixing = unmixing
+        # Write previews of the exported images and contact sheets
+        self.write_previews = write_previews
+        # Print every file that is read (the --verbose option)
+        self.verbose = verbose
+        # Lossless compression of the TIFF files: None or deflate (with the
+        # horizontal differencing predictor), and the zlib level of deflate.
+        # Higher levels are much slower and hardly make the files smaller
+        self.compression = compression
+        self.compression_level = compression_level
+        # Threads that compress the strips of a file in each worker, None for
+        # all processor cores (divided by the workers of a process pool)
+        self.compression_threads = compression_threads
+
+    def __repr__(self):
+        return 'ExportConfig({})'.format(', '.join('{}={!r}'.format(key, value)
+                                                   for key, value in sorted(vars(self).items())))
+
+    # Settings that change the output files. The manifest of a previous
+    # export is only used if they are the same
+    def manifest_settings(self):
+        settings = {'size': self.image_size, 'search_term': self.search_term, 'writer': self.image_writer,
+                    'stack': self.stack_pages}
+        if self.write_cubes:
+            settings['cube'] = True
+            settings['unmix'] = self.unmixing
+        if self.compression is not None:
+            settings['compression'] = [self.compression, self.compression_level]
+        return settings
@@ -0,0 +1,542 @@
+# Export of the index records: jobs, worker pool and plan
+# Read/write files and directories
+import os
+# Numeric Python
+import numpy
+# Run the export of snapshot directories in parallel
+import concurrent.futures
+# Stage timers
+import time
+# Configuration of the worker processes
+import copy
+from .config import ExportConfig, LCTF_channels, image_bands, image_dtypes, image_types, infer_image_size, lctf_bands
+from .index import image_output_name, record_output_name
+from .manifest import file_sha256, file_signature
+from .previews import preview_path, preview_sizes, write_image_previews
+from .quantify import quantify_images
+from .reader import iter_image_records
+from .stats import add_stage_time, format_seconds, merge_export_stats, new_export_stats, print_progress
+from .tiff import get_compression_executor, image_writers, read_image_rows
+from .unmix import unmix_cube
+
+
+# Stack or cube that an index record is written to with stack_pages or
+# write_cubes, as (group, time point, snapshot, 'cube' or image type).
+# None if the record is written to a file of its own
+def stack_output_key(record, config):
+    if config.write_cubes and record['field_name'] == 'ssa' and record['lctf_channel'] in lctf_bands:
+        return (record['group'], record['time_point'], record['snapshot_dir'], 'cube')
+    if config.stack_pages and record['lctf_channel'] is not None:
+        return (record['group'], record['time_point'], record['snapshot_dir'], record['field_name'])
+    return None
+
+# A stack or cube is always written with all its pages, so the records of
+# the index (all_records from query_index) that share a stack or cube with
+# a selected record are added to the selection
+def expand_stack_records(file_records, all_records, config=None):
+    if config is None:
+        config = ExportConfig()
+    selected_files = set(record['path'] for record in file_records)
+    stack_keys = set(stack_output_key(record, config) for record in file_records)
+    stack_keys.discard(None)
+    return file_records + [record for record in all_records if record['path'] not in selected_files and
+                           stack_output_key(record, config) in stack_keys]
+
+# Each snapshot directory (or LCTF channel directory) is independent
+# of the others, so its index records are the unit of work that is sent to the pool.
+# With stack_pages or write_cubes the records of a whole LCTF snapshot are
+# exported together. With unmixing the cube is unmixed into abundance maps.
+# If manifest_entries is given (the previous manifest entries of these
+# directories) unchanged files are skipped and new entries are returned.
+# With quantification_rules the ssa images of the directory are measured
+# together after they are written. The measurements of skipped files are
+# taken from their manifest entries.
+# Returns the images of the directory by image type (only if keep_images),
+# a list of (file, error) tuples for the files that could not be exported,
+# the manifest entries of the directory, the export statistics
+# and the quantification rows. config is the ExportConfig of the export
+def export_snapshot_directory(file_records, output_dir, keep_images=True, manifest_entries=None, use_hash=False,
+                              quantification_rules=None, config=None):
+    if config is None:
+        config = ExportConfig()
+    # Store the image arrays of this directory
+    snapshot_images = {}
+    # Store the files that failed instead of aborting the whole run
+    snapshot_errors = []
+    # Manifest entries of the files in this directory after this run
+    new_manifest_entries = {}
+    stats = new_export_stats()
+    # Signatures taken before the files are read
+    signatures = {}
+    # Exported ssa images and the measurements of this directory
+    quantify_infos = []
+    quantify_images_list = []
+    # Previews that are being written, as (image infos, futures)
+    preview_futures = []
+    quantification_rows = []
+
+    # Decide before reading the pixels if a file has to be exported again
+    # The updated manifest entry of an unchanged file is added to unchanged_entries
+    def is_unchanged(record, unchanged_entries):
+        if manifest_entries is None:
+            return False
+        source_file = record['path']
+        signatures[source_file] = file_signature(source_file, record['metadata_file'])
+        entry = manifest_entries.get(source_file)
+        if entry is None or 'checksums' not in entry or \
+                not all(os.path.isfile(os.path.join(output_dir, output_file)) for output_file in entry['checksums']):
+            return False
+        if quantification_rules is not None and record['field_name'] == 'ssa' and 'quantification' not in entry:
+            return False
+        if config.write_previews and not os.path.isfile(preview_path(output_dir, record_output_name(record),
+                                                                     preview_sizes[-1])):
+            return False
+        if all(entry.get(key) == value for key, value in signatures[source_file].items()):
+            unchanged = True
+        elif use_hash and 'sha256' in entry and entry['size'] == signatures[source_file]['size'] \
+                and entry['metadata_size'] == signatures[source_file]['metadata_size'] \
+                and entry['metadata_mtime_ns'] == signatures[source_file]['metadata_mtime_ns']:
+            # Only the time stamp changed, compare the content
+            unchanged = file_sha256(source_file) == entry['sha256']
+        else:
+            unchanged = False
+        if unchanged:
+            entry = dict(entry)
+            entry.update(signatures[source_file])
+            unchanged_entries[source_file] = entry
+        return unchanged
+
+    # Records written to the same output file: one file per image,
+    # one file per image type of an LCTF snapshot with stack_pages,
+    # or one cube of the ssa band images with write_cubes.
+    # Each group is a tuple of (image, stack or cube, records)
+    output_groups = []
+    stacks = {}
+    for record in file_records:
+        stack_key = stack_output_key(record, config)
+        if stack_key is None:
+            output_groups.append(('image', [record]))
+            continue
+        if stack_key not in stacks:
+            stacks[stack_key] = []
+            output_groups.append(('cube' if stack_key[-1] == 'cube' else 'stack', stacks[stack_key]))
+        stacks[stack_key].append(record)
+    # Pages are ordered by emission wavelength
+    for stack_records in stacks.values():
+        stack_records.sort(key=lambda record: LCTF_channels.index(record['lctf_channel']))
+
+    for group_kind, page_records in output_groups:
+        start_time = time.perf_counter()
+        try:
+            # A stack is only skipped if none of its pages changed, and all
+            # its pages were written to it in the same run (same checksums)
+            unchanged_entries = {}
+            unchanged = all([is_unchanged(record, unchanged_entries) for record in page_records])
+            if unchanged and group_kind != 'image':
+                page_checksums = [entry['checksums'] for entry in unchanged_entries.values()]
+                unchanged = all(checksums == page_checksums[0] for checksums in page_checksums)
+            add_stage_time(stats, 'manifest', start_time)
+            if unchanged:
+                new_manifest_entries.update(unchanged_entries)
+                stats['skipped_files'] += len(page_records)
+                if quantification_rules is not None:
+                    for entry in unchanged_entries.values():
+                        quantification_rows.extend(entry.get('quantification', []))
+                continue
+        except Exception as error:
+            snapshot_errors.extend((record['path'], '{}: {}'.format(type(error).__name__, error))
+                                   for record in page_records)
+            continue
+        page_infos = []
+        pages = []
+        for image_info, lazy_image in iter_image_records(page_records, snapshot_errors, stats=stats, config=config):
+            page_infos.append(image_info)
+            pages.append(lazy_image)
+        if not pages:
+            continue
+        try:
+            unmixed_files = []
+            # SHA-256 checksum of every output file
+            checksums = {}
+            if group_kind == 'cube':
+                # Copy the bands into one contiguous cube, so each band
+                # is read once and written straight from the cube.
+                # The copy reads the memory-mapped bands, it is timed as read
+                start_time = time.perf_counter()
+                cube = numpy.empty((len(pages),) + pages[0].shape, dtype=pages[0].dtype)
+                for band_num, page in enumerate(pages):
+                    cube[band_num] = page
+                pages = list(cube)
+                add_stage_time(stats, 'read', start_time, cube.nbytes)
+                if config.unmixing is not None:
+                    start_time = time.perf_counter()
+                    band_numbers = dict((image_info['lctf_channel'], band_num)
+                                        for band_num, image_info in enumerate(page_infos))
+                    missing_bands = [band for band in config.unmixing['bands'] if band not in band_numbers]
+                    if missing_bands:
+                        raise ValueError('LCTF band(s) {} missing for unmixing'.format(', '.join(missing_bands)))
+                    if [band_numbers[band] for band in config.unmixing['bands']] == list(range(len(cube))):
+                        abundances = unmix_cube(cube, config.unmixing)
+                    else:
+                        abundances = unmix_cube(cube[[band_numbers[band] for band in config.unmixing['bands']]],
+                                                config.unmixing)
+                    add_stage_time(stats, 'unmix', start_time, cube.nbytes)
+            if config.write_files:
+                if group_kind == 'cube':
+                    output_file = '{}.tif'.format(image_output_name(page_infos[0], 'LCTFcube'))
+                    page_descriptions = ['LCTF{}'.format(image_info['lctf_channel']) for image_info in page_infos]
+                elif group_kind == 'stack':
+                    output_file = '{}.tif'.format(image_output_name(page_infos[0], 'LCTF'))
+                    page_descriptions = ['LCTF{}'.format(image_info['lctf_channel']) for image_info in page_infos]
+                else:
+                    output_file = '{}.tif'.format(page_infos[0]['output_name'])
+                    page_descriptions = None
+                if config.write_previews:
+                    # The previews are made from the same copy of the pages
+                    # as the output file, so the raw files are only read once
+                    pages = [read_image_rows(page, stats) for page in pages]
+                # Save as .TIF file
+                checksums[output_file] = image_writers[config.image_writer](
+                    os.path.join(output_dir, output_file), pages, page_descriptions, stats,
+                    config.compression, config.compression_level, config.compression_threads)
+                if config.write_previews:
+                    # PNG compression takes most of the time of the previews, they are
+                    # written on the compression threads while the next files are exported
+                    start_time = time.perf_counter()
+                    executor = get_compression_executor(config.compression_threads)
+                    preview_futures.append((page_infos, [executor.submit(write_image_previews, output_dir,
+                                                                         image_info['output_name'], page)
+                                                         for image_info, page in zip(page_infos, pages)]))
+                    add_stage_time(stats, 'preview', start_time)
+                if group_kind == 'cube' and config.unmixing is not None:
+                    # One float32 abundance map per endmember
+                    for endmember_name, abundance in zip(config.unmixing['names'], abundances):
+                        unmixed_files.append('{}.tif'.format(image_output_name(page_infos[0],
+                                                                               'Unmixed{}'.format(endmember_name))))
+                        checksums[unmixed_files[-1]] = image_writers[config.image_writer](
+                            os.path.join(output_dir, unmixed_files[-1]), [abundance], [endmember_name], stats,
+                            config.compression, config.compression_level, config.compression_threads)
+                if manifest_entries is not None:
+                    # Record the exported files in the manifest
+                    for image_info in page_infos:
+                        entry = dict(signatures[image_info['source_file']])
+                        if use_hash:
+                            entry['sha256'] = file_sha256(image_info['source_file'])
+                        entry['metadata'] = {'Channel': image_info['channel_num'],
+                                             'DataName': image_info['snapshot_name']}
+                        entry['output_file'] = output_file
+                        if unmixed_files:
+                            entry['unmixed_files'] = unmixed_files
+                        entry['checksums'] = checksums
+                        new_manifest_entries[image_info['source_file']] = entry
+            if keep_images:
+                for image_info, lazy_image in zip(page_infos, pages):
+                    # Copy the image out of the memory-mapped file and
+                    # store the image array in dictionary
+                    image_dict = snapshot_images
+                    if (config.stack_pages or config.write_cubes) and image_info['lctf_channel'] is not None:
+                        image_dict = snapshot_images.setdefault(image_info['lctf_channel'], {})
+                    image_dict[image_types[image_info['field_name']]] = numpy.array(lazy_image)
+            if quantification_rules is not None:
+                for image_info, lazy_image in zip(page_infos, pages):
+                    if image_info['field_name'] == 'ssa':
+                        quantify_infos.append(image_info)
+                        quantify_images_list.append(lazy_image)
+            stats['files'] += len(pages)
+            stats['bytes'] += sum(page.nbytes for page in pages)
+        except Exception as error:
+            snapshot_errors.extend((image_info['source_file'], '{}: {}'.format(type(error).__name__, error))
+                                   for image_info in page_infos)
+
+    if preview_futures:
+        # Files without previews are exported again next time
+        start_time = time.perf_counter()
+        for page_infos, futures in preview_futures:
+            for image_info, future in zip(page_infos, futures):
+                try:
+                    future.result()
+                except Exception as error:
+                    snapshot_errors.append((image_info['source_file'], '{}: {}'.format(type(error).__name__, error)))
+                    new_manifest_entries.pop(image_info['source_file'], None)
+        add_stage_time(stats, 'preview', start_time)
+
+    if quantify_infos:
+        start_time = time.perf_counter()
+        try:
+            rows = quantify_images(quantify_infos, quantify_images_list, quantification_rules)
+            quantification_rows.extend(rows)
+            # Keep the measurements with the manifest entries, so
+            # they are still in the table when the files are skipped
+            file_rows = {}
+            for row in rows:
+                file_rows.setdefault(row['source_file'], []).append(row)
+            for source_file, source_rows in file_rows.items():
+                if source_file in new_manifest_entries:
+                    new_manifest_entries[source_file]['quantification'] = source_rows
+        except Exception as error:
+            # The files are exported again next time
+            for image_info in quantify_infos:
+                snapshot_errors.append((image_info['source_file'], '{}: {}'.format(type(error).__name__, error)))
+                new_manifest_entries.pop(image_info['source_file'], None)
+        add_stage_time(stats, 'quantify', start_time, sum(image.nbytes for image in quantify_images_list))
+    return snapshot_images, snapshot_errors, new_manifest_entries, stats, quantification_rows
+
+# Pool of export workers. The configuration is sent with every job,
+# so the same pool can run exports with different settings
+def create_export_executor(workers, pool_type='process'):
+    if pool_type == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+# Submit the export jobs to an executor and return their results in
+# submission order. update_progress is called with the records of each finished job
+def submit_export_jobs(executor, job_arguments, export_jobs, update_progress=None):
+    futures = [executor.submit(export_snapshot_directory, *arguments) for arguments in job_arguments]
+    if update_progress:
+        future_jobs = dict((future, export_job) for future, export_job in zip(futures, export_jobs))
+        for future in concurrent.futures.as_completed(futures):
+            update_progress(future_jobs[future][1])
+    return [future.result() for future in futures]
+
+# Run the collected export jobs of one experiment, either one at a time or in a pool.
+# Each job is a tuple of (image dictionary, index records of one directory or stack)
+# If a manifest is given, unchanged files are skipped and the
+# manifest is updated with the files of this run. If stats is given,
+# the statistics of all jobs are added to it. With progress a
+# progress line is printed each time a job is done. An executor from
+# create_export_executor can be given to reuse its workers between runs.
+# If quantification is given ({'rules': quantification rules, 'rows': []})
+# the measurements of the ssa images are added to its rows
+def run_export_jobs(export_jobs, output_dir, workers=1, pool_type='process', keep_images=True,
+                    manifest=None, use_hash=False, stats=None, progress=False, executor=None,
+                    quantification=None, config=None):
+    return run_experiment_jobs([(export_jobs, output_dir, manifest, quantification)], workers, pool_type,
+                               keep_images, use_hash, stats, progress, executor, config)
+
+# Run the export jobs of several experiments as one batch.
+# experiment_jobs is a list of (export jobs, output directory,
+# manifest or None, quantification or None).
+# The jobs of all experiments are started largest first, so a large snapshot
+# is not left to a single worker at the end of the run.
+# Results are collected in job order so the output is deterministic.
+# Returns the list of files that could not be exported
+def run_experiment_jobs(experiment_jobs, workers=1, pool_type='process', keep_images=True,
+                        use_hash=False, stats=None, progress=False, executor=None, config=None):
+    if config is None:
+        config = ExportConfig()
+    if pool_type == 'process' and workers > 1 and config.compression_threads is None:
+        # Every worker process has its own compression threads, so the
+        # processor cores are divided between the workers
+        config = copy.copy(config)
+        config.compression_threads = max(1, (os.cpu_count() or 1) // workers)
+    export_jobs = []
+    job_arguments = []
+    for experiment_export_jobs, output_dir, manifest, quantification in experiment_jobs:
+        quantification_rules = None
+        if quantification is not None:
+            quantification_rules = quantification['rules']
+        # Split the previous manifest by directory, so each job
+        # only receives the entries of its own directory
+        directory_entries = {}
+        if manifest is not None:
+            for source_file, entry in manifest['files'].items():
+                directory_entries.setdefault(os.path.dirname(source_file), {})[source_file] = entry
+        for export_job in experiment_export_jobs:
+            if manifest is None:
+                manifest_entries = None
+            else:
+                manifest_entries = {}
+                for directory in set(os.path.dirname(record['path']) for record in export_job[1]):
+                    manifest_entries.update(directory_entries.get(directory, {}))
+            export_jobs.append(export_job)
+            job_arguments.append((export_job[1], output_dir, keep_images, manifest_entries, use_hash,
+                                  quantification_rules, config))
+
+    # Progress is counted in files and input bytes of finished jobs
+    progress_counts = {'files': 0, 'bytes': 0}
+    total_files = sum(len(file_records) for _, file_records in export_jobs)
+    total_bytes = sum(record['size'] for _, file_records in export_jobs for record in file_records)
+    start_time = time.perf_counter()
+
+    def update_progress(file_records):
+        progress_counts['files'] += len(file_records)
+        progress_counts['bytes'] += sum(record['size'] for record in file_records)
+        print_progress(progress_counts['files'], total_files, progress_counts['bytes'], total_bytes, start_time)
+
+    # Largest jobs (in input bytes) first
+    job_order = sorted(range(len(export_jobs)),
+                       key=lambda job_num: -sum(record['size'] for record in export_jobs[job_num][1]))
+    ordered_jobs = [export_jobs[job_num] for job_num in job_order]
+    ordered_arguments = [job_arguments[job_num] for job_num in job_order]
+    if executor is not None or workers > 1:
+        if executor is None:
+            with create_export_executor(workers, pool_type) as executor:
+                ordered_results = submit_export_jobs(executor, ordered_arguments, ordered_jobs,
+                                                     progress and update_progress)
+        else:
+            ordered_results = submit_export_jobs(executor, ordered_arguments, ordered_jobs,
+                                                 progress and update_progress)
+    else:
+        ordered_results = []
+        for arguments, (_, file_records) in zip(ordered_arguments, ordered_jobs):
+            ordered_results.append(export_snapshot_directory(*arguments))
+            if progress:
+                update_progress(file_records)
+    results = [None] * len(export_jobs)
+    for job_num, result in zip(job_order, ordered_results):
+        results[job_num] = result
+
+    export_errors = []
+    total_stats = new_export_stats()
+    job_num = 0
+    for experiment_export_jobs, _, manifest, quantification in experiment_jobs:
+        manifest_files = {}
+        for image_dict, _ in experiment_export_jobs:
+            snapshot_images, snapshot_errors, manifest_entries, job_stats, quantification_rows = results[job_num]
+            job_num += 1
+            # Store image arrays in the dictionary of the snapshot
+            image_dict.update(snapshot_images)
+            export_errors.extend(snapshot_errors)
+            manifest_files.update(manifest_entries)
+            merge_export_stats(total_stats, job_stats)
+            if quantification is not None:
+                quantification['rows'].extend(quantification_rows)
+        if manifest is not None:
+            # The entries of the files of this run are replaced, files that
+            # failed are dropped so they are exported again next time.
+            # Entries of the files that were not selected are kept
+            export_files = set(record['path'] for _, file_records in experiment_export_jobs
+                               for record in file_records)
+            manifest['files'] = dict((source_file, entry) for source_file, entry in manifest['files'].items()
+                                     if source_file not in export_files)
+            manifest['files'].update(manifest_files)
+    if stats is not None:
+        merge_export_stats(stats, total_stats)
+    return export_errors
+
+# Assumed throughput of the export (read, reshape and write) used to
+# estimate the runtime of a plan, in MB/s
+plan_throughput = 40.0
+# Approximate size of the TIFF header and tags of one output file
+tiff_header_bytes = 512
+
+# Dry run: estimate the export of index records from the file sizes only,
+# before any pixel data is read. Files whose size matches no valid
+# Solaris geometry (or not the fixed --size) are listed as invalid
+def plan_export(file_records, throughput=plan_throughput, config=None):
+    if config is None:
+        config = ExportConfig()
+    plan = {
+        'input_files': 0,
+        'input_bytes': 0,
+        'output_files': 0,
+        'output_bytes': 0,
+        'geometries': {},
+        'invalid_files': [],
+        # Compressed output is smaller than output_bytes, by how much depends on the images
+        'compressed': config.compression is not None
+    }
+    output_stacks = set()
+    output_cubes = {}
+    for record in file_records:
+        plan['input_files'] += 1
+        plan['input_bytes'] += record['size']
+        image_size = infer_image_size(record['field_name'], record['size'])
+        if image_size is None or (config.image_size and image_size != config.image_size):
+            plan['invalid_files'].append((record['path'], record['size']))
+            continue
+        # Count the files of each type and geometry
+        geometry = '{} {}x{}{} {}'.format(record['field_name'], image_size, image_size,
+                                          'x{}'.format(image_bands[record['field_name']])
+                                          if image_bands[record['field_name']] > 1 else '',
+                                          image_dtypes[record['field_name']])
+        geometry_count = plan['geometries'].setdefault(geometry, [0, 0])
+        geometry_count[0] += 1
+        geometry_count[1] += record['size']
+        if config.write_files:
+            # Output images have the same pixel data as the input,
+            # LCTF channels are pages of one file with stack_pages,
+            # the ssa bands of a snapshot are one cube with write_cubes
+            if config.write_cubes and record['field_name'] == 'ssa' and record['lctf_channel'] in lctf_bands:
+                output_cubes[(record['group'], record['time_point'], record['snapshot_dir'])] = image_size
+            elif config.stack_pages and record['lctf_channel'] is not None:
+                output_stacks.add((record['group'], record['time_point'], record['snapshot_dir'],
+                                   record['field_name']))
+            else:
+                plan['output_files'] += 1
+            plan['output_bytes'] += record['size'] + tiff_header_bytes
+    plan['output_files'] += len(output_stacks) + len(output_cubes)
+    if config.unmixing is not None:
+        # One float32 abundance map per endmember and cube
+        plan['output_files'] += len(output_cubes) * len(config.unmixing['names'])
+        plan['output_bytes'] += sum((image_size * image_size * 4 + tiff_header_bytes) * len(config.unmixing['names'])
+                                    for image_size in output_cubes.values())
+    plan['estimated_seconds'] = plan['input_bytes'] / (throughput * 1e6)
+    return plan
+
+# Print the plan of an export as a short report
+def print_export_plan(plan, throughput=plan_throughput):
+    for geometry, (file_count, byte_count) in sorted(plan['geometries'].items()):
+        print('\t{}: {} file(s), {:.1f} MB'.format(geometry, file_count, byte_count / 1e6))
+    if plan['invalid_files']:
+        print('{} file(s) match no valid Solaris geometry:'.format(len(plan['invalid_files'])))
+        for invalid_file, byte_size in plan['invalid_files']:
+            print('\t{} ({} bytes)'.format(invalid_file, byte_size))
+    print('Input: {} file(s), {:.1f} MB'.format(plan['input_files'], plan['input_bytes'] / 1e6))
+    print('Output: {} file(s), {}{:.1f} MB'.format(plan['output_files'], 'at most ' if plan['compressed'] else '',
+                                                  plan['output_bytes'] / 1e6))
+    print('Estimated time: {} at {} MB/s'.format(format_seconds(plan['estimated_seconds']), throughput))
+
+# Group the index records by snapshot directory (or LCTF channel directory)
+# With stack_pages or write_cubes all LCTF channels of a snapshot are one job.
+# Returns the nested image dictionary and the list of export jobs.
+# If the group file is used, the dictionary starts with the group name
+def list_snapshot_jobs(file_records, config=None):
+    if config is None:
+        config = ExportConfig()
+    # Create a new dictionary to store the image data
+    solaris_images = {}
+    # Create an empty list to store the directories 
+    # that will need to be processed
+    export_jobs = []
+    job_records = {}
+    for record in file_records:
+        job_key = (record['group'], record['time_point'], record['snapshot_dir'],
+                   None if config.stack_pages or config.write_cubes else record['lctf_channel'])
+        if job_key not in job_records:
+            # Add empty sub-dictionaries for group, time point, snapshot and emission channel
+            image_dict = solaris_images
+            for key in job_key:
+                if key is not None:
+                    image_dict = image_dict.setdefault(key, {})
+            job_records[job_key] = []
+            export_jobs.append((image_dict, job_records[job_key]))
+        job_records[job_key].append(record)
+    return solaris_images, export_jobs
+
+# Export the images of index records (all images from query_index by default)
+# Returns the nested image dictionary (empty per snapshot unless
+# keep_images) and the list of files that could not be exported
+def export_experiment(file_records, output_dir, workers=1, pool_type='process', keep_images=True,
+                      manifest=None, use_hash=False, stats=None, progress=False, executor=None,
+                      quantification=None, config=None):
+    solaris_images, export_jobs = list_snapshot_jobs(file_records, config)
+    export_errors = run_export_jobs(export_jobs, output_dir, workers, pool_type, keep_images,
+                                    manifest, use_hash, stats, progress, executor, quantification, config)
+    return solaris_images, export_errors
+
+# Export several experiments in one batch, so the workers are shared by
+# all of them. experiments is a list of (index records, output directory,
+# manifest or None, quantification or None). Returns the image dictionary
+# of every experiment and the list of files that could not be exported
+def export_experiments(experiments, workers=1, pool_type='process', keep_images=True,
+                       use_hash=False, stats=None, progress=False, executor=None, config=None):
+    experiment_images = []
+    experiment_jobs = []
+    for file_records, output_dir, manifest, quantification in experiments:
+        solaris_images, export_jobs = list_snapshot_jobs(file_records, config)
+        experiment_images.append(solaris_images)
+        experiment_jobs.append((export_jobs, output_dir, manifest, quantification))
+    export_errors = run_experiment_jobs(experiment_jobs, workers, pool_type, keep_images,
+                                        use_hash, stats, progress, executor, config)
+    return experiment_images, export_errors
@@ -0,0 +1,315 @@
+# Index of the groups, time points, snapshots and image files of an experiment
+# Read/write files and directories
+import os
+# Read JSON file format
+import json
+# Find experiments by name pattern
+import glob
+# Stage timers
+import time
+from .config import ExportConfig, LCTF_channels, channels, image_types
+from .stats import add_stage_time
+
+
+# Remove unsafe characters in file name
+def safe_file_name(output_filename):
+    return "".join([c for c in output_filename if c.isalpha() or c.isdigit() or c==' ' or c=='_']).rstrip()
+
+# The experiment index is cached in the output directory, so the
+# input directory does not have to be crawled again on every run
+index_file_name = 'solaris_experiment_index.json'
+
+# Read a JSON .svd file, returns (data, error message)
+def read_svd_file(svd_path, stats=None):
+    start_time = time.perf_counter()
+    try:
+        with open(svd_path) as svd_file:
+            return json.load(svd_file), None
+    except (OSError, ValueError) as error:
+        return None, '{}: {}'.format(type(error).__name__, error)
+    finally:
+        add_stage_time(stats, 'metadata', start_time)
+
+# List a directory once with os.scandir, sorted by name so the
+# order of processing does not depend on the file system
+def scan_directory(directory):
+    with os.scandir(directory) as entries:
+        return sorted(entries, key=lambda entry: entry.name)
+
+# Index one time point directory. Every directory is listed once and every
+# metadata.svd is parsed once, LCTF channels share the metadata of the snapshot.
+# The modification times of the directories are stored, so a cached
+# index of the time point can be reused if none of them changed.
+# Only files and directories with search_term in their name are indexed
+def index_timepoint(timepoint_dir, timepoint_mtime_ns, search_term, stats=None):
+    timepoint_index = {'directories': {'.': timepoint_mtime_ns}, 'snapshots': [], 'error': None}
+    try:
+        snapshot_entries = [entry for entry in scan_directory(timepoint_dir)
+                            if search_term in entry.name and entry.is_dir()]
+        for snapshot_entry in snapshot_entries:
+            timepoint_index['directories'][snapshot_entry.name] = snapshot_entry.stat().st_mtime_ns
+            # Image files are stored as [LCTF channel, file name, size, mtime],
+            # the metadata.svd file as [size, mtime]
+            snapshot = {'snapshot_dir': snapshot_entry.name, 'metadata': None, 'metadata_stat': None, 'error': None,
+                        'files': []}
+            for entry in scan_directory(snapshot_entry.path):
+                if entry.name == 'metadata.svd':
+                    metadata_stat = entry.stat()
+                    snapshot['metadata_stat'] = [metadata_stat.st_size, metadata_stat.st_mtime_ns]
+                    snapshot_metadata, snapshot['error'] = read_svd_file(entry.path, stats)
+                    if snapshot_metadata is not None:
+                        try:
+                            # Only the fields used for the file names are kept
+                            snapshot['metadata'] = {'Channel': str(snapshot_metadata['Channel']),
+                                                    'DataName': snapshot_metadata['DataName']}
+                        except (KeyError, TypeError) as error:
+                            snapshot['error'] = '{}: {}'.format(type(error).__name__, error)
+                # Using the LCTF, the software can perform spectral unmixing
+                # If that is the case, there will be multiple emission wavelengths
+                elif 'Unmixed' in snapshot_entry.name:
+                    if entry.name in LCTF_channels and entry.is_dir():
+                        timepoint_index['directories'][os.path.join(snapshot_entry.name, entry.name)] = entry.stat().st_mtime_ns
+                        for channel_entry in scan_directory(entry.path):
+                            if search_term in channel_entry.name and channel_entry.is_file():
+                                channel_stat = channel_entry.stat()
+                                snapshot['files'].append([entry.name, channel_entry.name,
+                                                          channel_stat.st_size, channel_stat.st_mtime_ns])
+                elif search_term in entry.name and entry.is_file():
+                    entry_stat = entry.stat()
+                    snapshot['files'].append([None, entry.name, entry_stat.st_size, entry_stat.st_mtime_ns])
+            if snapshot['files'] and snapshot['metadata'] is None and snapshot['error'] is None:
+                snapshot['error'] = 'metadata.svd not found'
+            timepoint_index['snapshots'].append(snapshot)
+    except OSError as error:
+        timepoint_index['error'] = '{}: {}'.format(type(error).__name__, error)
+    return timepoint_index
+
+# A cached time point is still valid if none of its directories changed,
+# new snapshots or image files change the modification time of their directory.
+# A time point with a snapshot that could not be indexed (for example a
+# metadata.svd that was still being written) is always indexed again
+def timepoint_unchanged(timepoint_dir, timepoint_index):
+    if timepoint_index.get('error') is not None or \
+            any(snapshot['error'] is not None for snapshot in timepoint_index['snapshots']):
+        return False
+    try:
+        return all(os.stat(os.path.join(timepoint_dir, directory)).st_mtime_ns == mtime_ns
+                   for directory, mtime_ns in timepoint_index['directories'].items())
+    except OSError:
+        return False
+
+# Writing to a file does not change the modification time of its directory, so
+# the size and modification time of every file of a reused time point are read
+# again (a file indexed while the Solaris was still writing it had a partial
+# size). Returns the updated time point index, or None if a file was removed
+# or a metadata.svd changed, as the time point has to be indexed again
+def refresh_timepoint_files(timepoint_dir, timepoint_index):
+    snapshots = []
+    try:
+        for snapshot in timepoint_index['snapshots']:
+            snapshot = dict(snapshot)
+            # Indexes of earlier versions have no metadata_stat
+            if snapshot['metadata'] is not None or snapshot.get('metadata_stat') is not None:
+                metadata_stat = os.stat(os.path.join(timepoint_dir, snapshot['snapshot_dir'], 'metadata.svd'))
+                if snapshot.get('metadata_stat') != [metadata_stat.st_size, metadata_stat.st_mtime_ns]:
+                    return None
+            snapshot_files = []
+            for lctf_channel, file_name, _, _ in snapshot['files']:
+                file_dir = os.path.join(timepoint_dir, snapshot['snapshot_dir'])
+                if lctf_channel is not None:
+                    file_dir = os.path.join(file_dir, lctf_channel)
+                file_stat = os.stat(os.path.join(file_dir, file_name))
+                snapshot_files.append([lctf_channel, file_name, file_stat.st_size, file_stat.st_mtime_ns])
+            snapshot['files'] = snapshot_files
+            snapshots.append(snapshot)
+    except OSError:
+        return None
+    timepoint_index = dict(timepoint_index)
+    timepoint_index['snapshots'] = snapshots
+    return timepoint_index
+
+# Build the index of an experiment with a single os.scandir pass.
+# The groups.svd file is parsed once. If a previous index is given,
+# the time points that did not change are taken from it, with the current
+# size and modification time of their files
+def build_experiment_index(input_dir, previous_index=None, stats=None, config=None):
+    if config is None:
+        config = ExportConfig()
+    search_term = config.search_term
+    start_time = time.perf_counter()
+    if stats is not None:
+        metadata_seconds = stats['seconds']['metadata']
+    if previous_index is not None and (previous_index.get('input_dir') != input_dir or
+                                       previous_index.get('search_term') != search_term):
+        previous_index = None
+    index = {'input_dir': input_dir, 'search_term': search_term, 'groups': [], 'groups_mtime_ns': None,
+             'groups_error': None, 'timepoints': {}}
+    for entry in scan_directory(input_dir):
+        if entry.name == 'groups.svd' and entry.is_file():
+            # Group file is used to store names of experiments, but it is not always used
+            index['groups_mtime_ns'] = entry.stat().st_mtime_ns
+            if previous_index is not None and previous_index['groups_mtime_ns'] == index['groups_mtime_ns']:
+                index['groups'] = previous_index['groups']
+            else:
+                study_data, index['groups_error'] = read_svd_file(entry.path, stats)
+                # This may be empty (If it is empty the time points are not grouped)
+                index['groups'] = study_data or []
+        elif entry.is_dir():
+            # Within each group/etxperiment there can be multiple subjects/timepoints
+            previous_timepoint = None
+            if previous_index is not None:
+                previous_timepoint = previous_index['timepoints'].get(entry.name)
+            timepoint_index = None
+            if previous_timepoint is not None and timepoint_unchanged(entry.path, previous_timepoint):
+                timepoint_index = refresh_timepoint_files(entry.path, previous_timepoint)
+            if timepoint_index is None:
+                timepoint_index = index_timepoint(entry.path, entry.stat().st_mtime_ns, search_term, stats)
+            index['timepoints'][entry.name] = timepoint_index
+    if stats is not None:
+        # Listing time, without the time spent parsing metadata files
+        add_stage_time(stats, 'scan', start_time)
+        stats['seconds']['scan'] -= stats['seconds']['metadata'] - metadata_seconds
+    return index
+
+# Read the cached index from index_path and update it with the
+# time points that changed. With rebuild the whole experiment is indexed again
+def load_experiment_index(input_dir, index_path=None, rebuild=False, stats=None, config=None):
+    previous_index = None
+    if index_path is not None and not rebuild and os.path.isfile(index_path):
+        previous_index, _ = read_svd_file(index_path)
+    index = build_experiment_index(input_dir, previous_index, stats, config)
+    if index_path is not None:
+        save_experiment_index(index, index_path)
+    return index
+
+# Write the index to a temporary file first, so an
+# interrupted run never leaves a half written index behind
+def save_experiment_index(index, index_path):
+    with open(index_path + '.tmp', 'w') as index_file:
+        json.dump(index, index_file, separators=(',', ':'))
+    os.replace(index_path + '.tmp', index_path)
+
+# Generator over the image files of an index, one dictionary per file with
+# group, time point, snapshot, channel, field type, path and byte size.
+# If the group file is used, the time points are listed by group
+def index_records(index):
+    if index['groups']:
+        group_timepoints = [(group['Name'], time_point) for group in index['groups']
+                            for time_point in group['SubjectNames']]
+    else:
+        group_timepoints = [(None, time_point) for time_point in sorted(index['timepoints'])]
+    for group_name, time_point in group_timepoints:
+        timepoint_index = index['timepoints'].get(time_point)
+        if timepoint_index is None:
+            continue
+        for snapshot in timepoint_index['snapshots']:
+            if snapshot['metadata'] is None:
+                continue
+            snapshot_path = os.path.join(index['input_dir'], time_point, snapshot['snapshot_dir'])
+            for lctf_channel, file_name, file_size, file_mtime_ns in snapshot['files']:
+                if lctf_channel is None:
+                    file_dir = snapshot_path
+                else:
+                    file_dir = os.path.join(snapshot_path, lctf_channel)
+                yield {
+                    'group': group_name,
+                    'time_point': time_point,
+                    'snapshot_dir': snapshot['snapshot_dir'],
+                    'lctf_channel': lctf_channel,
+                    'channel_num': snapshot['metadata']['Channel'],
+                    'channel_name': channels.get(snapshot['metadata']['Channel'], 'ChannelError'),
+                    'snapshot_name': snapshot['metadata']['DataName'],
+                    'file_name': file_name,
+                    'field_name': os.path.splitext(file_name)[1][1:],
+                    'path': os.path.join(file_dir, file_name),
+                    'metadata_file': os.path.join(file_dir, '..', 'metadata.svd') if lctf_channel is not None
+                                     else os.path.join(file_dir, 'metadata.svd'),
+                    'size': file_size,
+                    'mtime_ns': file_mtime_ns
+                }
+
+# Problems found while indexing as a list of (path, error) tuples
+def index_errors(index):
+    errors = []
+    if index['groups_error'] is not None:
+        errors.append((os.path.join(index['input_dir'], 'groups.svd'), index['groups_error']))
+    for group in index['groups']:
+        for time_point in group['SubjectNames']:
+            if time_point not in index['timepoints']:
+                errors.append((os.path.join(index['input_dir'], time_point), 'time point directory not found'))
+    for time_point, timepoint_index in sorted(index['timepoints'].items()):
+        if timepoint_index['error'] is not None:
+            errors.append((os.path.join(index['input_dir'], time_point), timepoint_index['error']))
+        for snapshot in timepoint_index['snapshots']:
+            if snapshot['files'] and snapshot['metadata'] is None:
+                errors.append((os.path.join(index['input_dir'], time_point, snapshot['snapshot_dir'], 'metadata.svd'),
+                               snapshot['error']))
+    return errors
+
+# Select image files from the index, for example all 800 nm ssa images of a group:
+#   query_index(index, group='Group X', channel='800', field_name='ssa')
+# channel matches the excitation channel or the LCTF emission channel.
+# Side-by-side images are only included with include_side_by_side
+def query_index(index, group=None, time_point=None, channel=None, field_name=None, include_side_by_side=False):
+    records = []
+    for record in index_records(index):
+        if group is not None and record['group'] != group:
+            continue
+        if time_point is not None and record['time_point'] != time_point:
+            continue
+        if channel is not None and channel not in (record['channel_name'], record['lctf_channel']):
+            continue
+        if field_name is not None and record['field_name'] != field_name:
+            continue
+        if record['field_name'] == 'ssm' and not include_side_by_side:
+            continue
+        records.append(record)
+    return records
+
+# Construct output file name (without extension) of an image
+# The group name is only included if the group file is used
+def image_output_name(image_info, channel_label):
+    if image_info['group'] is None:
+        name_prefix = [image_info['time_point']]
+    else:
+        name_prefix = [image_info['group'], image_info['time_point']]
+    return safe_file_name('_'.join(name_prefix + [image_types[image_info['field_name']],
+                                                  channel_label,
+                                                  image_info['snapshot_name']]))
+
+# Output name of the image of an index record. LCTF images are named
+# by emission wavelength, all other images by the excitation channel
+def record_output_name(record):
+    if record['lctf_channel'] is None:
+        return image_output_name(record, record['channel_name'])
+    return image_output_name(record, 'LCTF{}'.format(record['lctf_channel']))
+
+# Experiment directories in input_root_dir that match the names or glob
+# patterns (e.g. "OVCAR*"), all experiments if none are given. With since
+# (a time stamp) only experiments with a time point directory (or the
+# experiment directory itself) modified since then are kept.
+# Returns the experiment names relative to input_root_dir
+def find_experiments(input_root_dir, patterns=None, since=None):
+    experiment_names = []
+    for pattern in patterns or ['*']:
+        if os.path.isdir(os.path.join(input_root_dir, pattern)):
+            # Names are used as they are, even if they contain [ or *
+            matches = [pattern]
+        else:
+            matches = sorted(os.path.relpath(path, input_root_dir) for path in
+                             glob.glob(os.path.join(glob.escape(input_root_dir), pattern)) if os.path.isdir(path))
+        for experiment_name in matches:
+            if experiment_name not in experiment_names:
+                experiment_names.append(experiment_name)
+    if since is not None:
+        recent_names = []
+        for experiment_name in experiment_names:
+            experiment_dir = os.path.join(input_root_dir, experiment_name)
+            # New snapshots change the modification time of their time point
+            mtimes = [os.stat(experiment_dir).st_mtime]
+            mtimes.extend(entry.stat().st_mtime for entry in scan_directory(experiment_dir) if entry.is_dir())
+            if max(mtimes) >= since:
+                recent_names.append(experiment_name)
+        experiment_names = recent_names
+    return experiment_names
+
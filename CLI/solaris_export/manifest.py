@@ -0,0 +1,116 @@
+# Manifest of the exported files, used to skip unchanged files
+# Read/write files and directories
+import os
+# Read/write JSON file format
+import json
+# Content hashes for the export manifest
+import hashlib
+
+
+# The manifest in the output directory records every exported image,
+# so a later run can skip the files that did not change
+manifest_file_name = 'solaris_export_manifest.json'
+
+# Read the manifest of a previous run. The entries are only reused if the
+# run used the same settings, otherwise every file is exported again
+def load_export_manifest(output_dir, settings):
+    manifest = {'settings': settings, 'files': {}}
+    manifest_path = os.path.join(output_dir, manifest_file_name)
+    if os.path.isfile(manifest_path):
+        try:
+            with open(manifest_path) as manifest_file:
+                previous_manifest = json.load(manifest_file)
+        except ValueError:
+            print('Ignoring unreadable manifest: {}'.format(manifest_path))
+            return manifest
+        if previous_manifest.get('settings') == settings:
+            manifest['files'] = previous_manifest.get('files', {})
+    return manifest
+
+# Write the manifest to a temporary file first, so an interrupted
+# run never leaves a half written manifest behind
+def save_export_manifest(output_dir, manifest):
+    manifest_path = os.path.join(output_dir, manifest_file_name)
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+# Drop the entries of the files that are no longer in the index (file_records
+# from query_index), for example of snapshots removed from the input directory
+def prune_export_manifest(manifest, file_records):
+    indexed_files = set(record['path'] for record in file_records)
+    manifest['files'] = dict((source_file, entry) for source_file, entry in manifest['files'].items()
+                             if source_file in indexed_files)
+
+# Size and modification time of an image file and its metadata file
+def file_signature(source_file, metadata_file):
+    source_stat = os.stat(source_file)
+    metadata_stat = os.stat(metadata_file)
+    return {
+        'size': source_stat.st_size,
+        'mtime_ns': source_stat.st_mtime_ns,
+        'metadata_size': metadata_stat.st_size,
+        'metadata_mtime_ns': metadata_stat.st_mtime_ns
+    }
+
+# Content hash of an image file, read in blocks
+def file_sha256(source_file):
+    digest = hashlib.sha256()
+    with open(source_file, 'rb') as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Checksums of the output files in the format of sha256sum, so an archived
+# export can also be checked with "sha256sum -c" in the output directory
+checksum_file_name = 'solaris_export_checksums.sha256'
+
+# Write the checksums of all output files recorded in the manifest
+def save_output_checksums(output_dir, manifest):
+    checksums = {}
+    for entry in manifest['files'].values():
+        checksums.update(entry.get('checksums', {}))
+    checksum_path = os.path.join(output_dir, checksum_file_name)
+    with open(checksum_path + '.tmp', 'w', newline='\n') as checksum_file:
+        for output_file, checksum in sorted(checksums.items()):
+            checksum_file.write('{} *{}\n'.format(checksum, output_file))
+    os.replace(checksum_path + '.tmp', checksum_path)
+
+# Check an export against its manifest without decompressing the output:
+# the checksum of every output file, and the size and modification time of
+# every source file (the content hash if only the time stamp changed and
+# the manifest has one). Returns the number of output files that were
+# checked and a list of (file, error) tuples
+def verify_export(output_dir):
+    manifest_path = os.path.join(output_dir, manifest_file_name)
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError) as error:
+        return 0, [(manifest_path, '{}: {}'.format(type(error).__name__, error))]
+    errors = []
+    checksums = {}
+    for source_file, entry in sorted(manifest['files'].items()):
+        if 'checksums' not in entry:
+            errors.append((source_file, 'no checksum of the output was recorded, export it again'))
+        checksums.update(entry.get('checksums', {}))
+        try:
+            source_stat = os.stat(source_file)
+        except OSError as error:
+            errors.append((source_file, '{}: {}'.format(type(error).__name__, error)))
+            continue
+        if source_stat.st_size != entry['size']:
+            source_changed = True
+        elif source_stat.st_mtime_ns == entry['mtime_ns']:
+            source_changed = False
+        else:
+            source_changed = 'sha256' not in entry or file_sha256(source_file) != entry['sha256']
+        if source_changed:
+            errors.append((source_file, 'source file changed since it was exported'))
+    for output_file, checksum in sorted(checksums.items()):
+        output_path = os.path.join(output_dir, output_file)
+        if not os.path.isfile(output_path):
+            errors.append((output_path, 'output file not found'))
+        elif file_sha256(output_path) != checksum:
+            errors.append((output_path, 'checksum does not match the manifest'))
+    return len(checksums), errors
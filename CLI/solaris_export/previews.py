@@ -0,0 +1,155 @@
+# PNG previews and contact sheets of the exported images
+# Read/write files and directories
+import os
+# Numeric Python
+import numpy
+# Pack the binary fields of the PNG chunks
+import struct
+# Compress the PNG previews
+import zlib
+from .index import query_index, record_output_name, safe_file_name
+
+
+# Previews of the exported images, written to the previews sub-directory
+# of the output directory: one PNG per image for every preview size
+# (previews/<size>/<output name>.png) and one contact sheet per time point
+preview_dir_name = 'previews'
+# Preview sizes, each is the block mean of the image (or the previous size)
+preview_sizes = [512, 256, 128]
+# Monochrome previews are scaled from these percentiles of the image to 0-255
+preview_percentiles = (0.5, 99.5)
+# zlib level and strategy of the PNG files. Previews have few repeated byte
+# strings, so Huffman coding alone makes them as small as LZ77 matching
+# at level 1, in half the time
+preview_compression = 1
+preview_compression_strategy = zlib.Z_HUFFMAN_ONLY
+# Thumbnails (the smallest preview size) per row of a contact sheet
+contact_sheet_columns = 8
+contact_sheet_gap = 4
+
+# Write an 8-bit grayscale (rows, columns) or RGB (rows, columns, 3) PNG file
+# Rows are stored without a filter
+def write_png(output_path, image):
+    image_height, image_width = image.shape[:2]
+    color_type = 2 if image.ndim == 3 else 0
+    raw_rows = numpy.zeros((image_height, 1 + image[0].size), dtype=numpy.uint8)
+    raw_rows[:, 1:] = image.reshape(image_height, -1)
+
+    def png_chunk(chunk_type, chunk_data):
+        return (struct.pack('>I', len(chunk_data)) + chunk_type + chunk_data +
+                struct.pack('>I', zlib.crc32(chunk_type + chunk_data) & 0xffffffff))
+
+    compressor = zlib.compressobj(preview_compression, zlib.DEFLATED, zlib.MAX_WBITS, 8,
+                                  preview_compression_strategy)
+    with open(output_path, 'wb') as png_file:
+        png_file.write(b'\x89PNG\r\n\x1a\n' +
+                       png_chunk(b'IHDR', struct.pack('>IIBBBBB', image_width, image_height, 8, color_type, 0, 0, 0)) +
+                       png_chunk(b'IDAT', compressor.compress(raw_rows.data) + compressor.flush()) +
+                       png_chunk(b'IEND', b''))
+
+# Read a PNG file written by write_png (8-bit, no filters)
+def read_png(png_path):
+    with open(png_path, 'rb') as png_file:
+        png_data = png_file.read()
+    position = 8
+    compressed_data = []
+    while position < len(png_data):
+        chunk_length, chunk_type = struct.unpack('>I4s', png_data[position:position + 8])
+        chunk_data = png_data[position + 8:position + 8 + chunk_length]
+        if chunk_type == b'IHDR':
+            image_width, image_height, bit_depth, color_type = struct.unpack('>IIBB', chunk_data[:10])
+        elif chunk_type == b'IDAT':
+            compressed_data.append(chunk_data)
+        position += chunk_length + 12
+    samples_per_pixel = 3 if color_type == 2 else 1
+    raw_rows = numpy.frombuffer(zlib.decompress(b''.join(compressed_data)), dtype=numpy.uint8)
+    raw_rows = raw_rows.reshape(image_height, 1 + image_width * samples_per_pixel)
+    if bit_depth != 8 or raw_rows[:, 0].any():
+        raise ValueError('{} was not written by write_png'.format(png_path))
+    image = raw_rows[:, 1:].reshape(image_height, image_width, samples_per_pixel)
+    return image[:, :, 0] if samples_per_pixel == 1 else image
+
+# Path of the preview of an image (by its output name) at one preview size
+def preview_path(output_dir, output_name, preview_size):
+    return os.path.join(output_dir, preview_dir_name, str(preview_size), '{}.png'.format(output_name))
+
+# Write the previews of one image from the array that was just exported
+# (in memory, see export_snapshot_directory). Each size is the block mean of
+# the previous one, halving the size with sums of 2 x 2 pixels, so the full
+# image is only read once. The means are rounded to integers (Solaris images
+# are 8 or 16-bit), and monochrome means are scaled with a lookup table of
+# all 16-bit values, from the percentiles of the smallest preview.
+# Color images are only downsampled
+def write_image_previews(output_dir, output_name, image):
+    sizes = [preview_size for preview_size in preview_sizes if preview_size <= image.shape[0]]
+    previews = []
+    # Sums of pixel blocks and the number of pixels per block. Sums of up
+    # to 8 x 8 pixels of an 8-bit image fit in 16 bits
+    block_dtype = numpy.uint16 if image.dtype == numpy.uint8 else numpy.uint32
+    block_sums = image
+    block_pixels = 1
+    for preview_size in sizes:
+        while block_sums.shape[0] > preview_size:
+            # Pairs of rows are added first, so only half of the image
+            # is converted to the wider type
+            row_sums = block_sums[0::2].astype(block_dtype)
+            row_sums += block_sums[1::2]
+            block_sums = row_sums[:, 0::2] + row_sums[:, 1::2]
+            block_pixels *= 4
+        previews.append((block_sums + block_pixels // 2) // block_pixels)
+    if image.ndim == 2:
+        low, high = numpy.percentile(previews[-1], preview_percentiles)
+        scale = 255.0 / max(high - low, 1)
+        preview_values = numpy.clip(numpy.round((numpy.arange(numpy.iinfo(image.dtype).max + 1) - low) * scale),
+                                    0, 255).astype(numpy.uint8)
+    for preview_size, preview in zip(sizes, previews):
+        if image.ndim == 2:
+            preview = preview_values[preview]
+        else:
+            preview = preview.astype(numpy.uint8)
+        os.makedirs(os.path.dirname(preview_path(output_dir, output_name, preview_size)), exist_ok=True)
+        write_png(preview_path(output_dir, output_name, preview_size), preview)
+
+# Write one contact sheet per time point with the thumbnails of all
+# exported images, one row (or more) per snapshot. index records are
+# grouped by time point, missing thumbnails are left out
+def write_contact_sheets(output_dir, file_records):
+    thumbnail_size = preview_sizes[-1]
+    timepoint_records = {}
+    for record in file_records:
+        timepoint_records.setdefault((record['group'], record['time_point']), []).append(record)
+    for (group, time_point), records in timepoint_records.items():
+        rows = []
+        snapshot_thumbnails = {}
+        for record in sorted(records, key=lambda record: (record['snapshot_dir'], record_output_name(record))):
+            thumbnail_path = preview_path(output_dir, record_output_name(record), thumbnail_size)
+            if os.path.isfile(thumbnail_path):
+                snapshot_thumbnails.setdefault(record['snapshot_dir'], []).append(read_png(thumbnail_path))
+        for snapshot_dir in sorted(snapshot_thumbnails):
+            thumbnails = snapshot_thumbnails[snapshot_dir]
+            for column in range(0, len(thumbnails), contact_sheet_columns):
+                rows.append(thumbnails[column:column + contact_sheet_columns])
+        if not rows:
+            continue
+        tile_size = thumbnail_size + contact_sheet_gap
+        contact_sheet = numpy.zeros((len(rows) * tile_size + contact_sheet_gap,
+                                     contact_sheet_columns * tile_size + contact_sheet_gap, 3), dtype=numpy.uint8)
+        for row_num, thumbnails in enumerate(rows):
+            for column_num, thumbnail in enumerate(thumbnails):
+                if thumbnail.ndim == 2:
+                    thumbnail = thumbnail[:, :, numpy.newaxis]
+                top = row_num * tile_size + contact_sheet_gap
+                left = column_num * tile_size + contact_sheet_gap
+                contact_sheet[top:top + thumbnail_size, left:left + thumbnail_size] = thumbnail
+        name_prefix = [time_point] if group is None else [group, time_point]
+        write_png(os.path.join(output_dir, preview_dir_name,
+                               '{}.png'.format(safe_file_name('_'.join(name_prefix + ['contact sheet'])))),
+                  contact_sheet)
+
+# Write the contact sheets of the time points of file_records (the files of
+# an export) from all index records of these time points, so the sheets keep
+# the thumbnails of the snapshots and channels that were not exported again
+def write_index_contact_sheets(output_dir, index, file_records):
+    time_points = set((record['group'], record['time_point']) for record in file_records)
+    write_contact_sheets(output_dir, [record for record in query_index(index)
+                                      if (record['group'], record['time_point']) in time_points])
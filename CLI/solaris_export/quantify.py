@@ -0,0 +1,181 @@
+# Quantification of the exported monochrome images
+# Read/write files and directories
+import os
+# Numeric Python
+import numpy
+# Read JSON file format
+import json
+# Write the quantification table
+import csv
+
+
+# Quantification of the monochrome (ssa) images, the measurements that are
+# otherwise made in ImageJ: integrated density and thresholded area for
+# every image, region of interest (ROI) and threshold rule.
+# The rules are read from a JSON file, for example:
+# {
+#   "rois": [{"name": "tumor", "rect": [x, y, width, height]},
+#            {"name": "organ", "mask": "organ_mask.tif"}],
+#   "thresholds": [{"name": "1000", "value": 1000},
+#                  {"name": "p99", "percentile": 99},
+#                  {"name": "2sd", "std": 2},
+#                  {"name": "otsu", "method": "otsu"}]
+# }
+# Coordinates are pixels of the exported image. A mask is an image of the
+# same size, its non-zero pixels are part of the ROI (paths are relative to
+# the rules file). The whole image is always measured as the ROI "image".
+# Thresholds are found from the whole image, pixels above it are counted
+quantification_file_name = 'solaris_quantification.csv'
+quantification_columns = ['group', 'time_point', 'channel', 'snapshot_name', 'snapshot_dir', 'roi',
+                          'threshold', 'threshold_value', 'pixels', 'min', 'max', 'mean',
+                          'integrated_density', 'area', 'area_fraction', 'thresholded_integrated_density',
+                          'source_file']
+# Masks read by each process, by file path
+roi_masks = {}
+
+# Read and check the quantification rules
+# Raises ValueError if the rules are not valid
+def load_quantification_rules(rules_file):
+    with open(rules_file) as data_file:
+        rules = json.load(data_file)
+    rules_dir = os.path.dirname(os.path.abspath(rules_file))
+    rois = [{'name': 'image'}]
+    for roi in rules.get('rois', []):
+        if 'name' not in roi:
+            raise ValueError('ROI without a name: {}'.format(roi))
+        if 'rect' in roi:
+            if len(roi['rect']) != 4 or not all(isinstance(value, int) and value >= 0 for value in roi['rect']):
+                raise ValueError('ROI {}: rect must be [x, y, width, height] in pixels'.format(roi['name']))
+            rois.append({'name': str(roi['name']), 'rect': list(roi['rect'])})
+        elif 'mask' in roi:
+            rois.append({'name': str(roi['name']), 'mask': os.path.join(rules_dir, roi['mask'])})
+        else:
+            raise ValueError('ROI {} needs a rect or a mask'.format(roi['name']))
+    thresholds = []
+    for threshold in rules.get('thresholds', []):
+        if 'name' not in threshold:
+            raise ValueError('Threshold without a name: {}'.format(threshold))
+        rule = {'name': str(threshold['name'])}
+        for key in ['value', 'percentile', 'std']:
+            if key in threshold:
+                rule[key] = float(threshold[key])
+        if threshold.get('method') == 'otsu':
+            rule['method'] = 'otsu'
+        if len(rule) != 2:
+            raise ValueError('Threshold {} needs one of value, percentile, std or "method": "otsu"'.format(
+                threshold['name']))
+        thresholds.append(rule)
+    return {'rois': rois, 'thresholds': thresholds}
+
+# Pixels of a ROI in a stack of images (images, rows, columns)
+# as an array of (images, pixels)
+def roi_pixels(image_stack, roi):
+    image_shape = image_stack.shape[1:]
+    if 'rect' in roi:
+        x, y, roi_width, roi_height = roi['rect']
+        pixels = image_stack[:, y:y + roi_height, x:x + roi_width].reshape(len(image_stack), -1)
+    elif 'mask' in roi:
+        if roi['mask'] not in roi_masks:
+            from skimage import io
+            mask = io.imread(roi['mask'])
+            if mask.ndim == 3:
+                mask = mask.any(axis=2)
+            roi_masks[roi['mask']] = mask != 0
+        mask = roi_masks[roi['mask']]
+        if mask.shape != image_shape:
+            raise ValueError('ROI {} mask is {}x{}, the image is {}x{}'.format(roi['name'], mask.shape[1],
+                                                                             mask.shape[0], image_shape[1],
+                                                                             image_shape[0]))
+        pixels = image_stack[:, mask]
+    else:
+        pixels = image_stack.reshape(len(image_stack), -1)
+    if pixels.shape[1] == 0:
+        raise ValueError('ROI {} has no pixels in a {}x{} image'.format(roi['name'], image_shape[1], image_shape[0]))
+    return pixels
+
+# Threshold of every image in a stack of flattened images (images, pixels)
+def threshold_values(flat_stack, threshold):
+    if 'value' in threshold:
+        return numpy.full(len(flat_stack), threshold['value'])
+    if 'percentile' in threshold:
+        return numpy.percentile(flat_stack, threshold['percentile'], axis=1)
+    if 'std' in threshold:
+        return flat_stack.mean(axis=1) + threshold['std'] * flat_stack.std(axis=1)
+    # Otsu thresholds, skimage is only imported when they are used
+    from skimage import filters
+    return numpy.array([filters.threshold_otsu(flat_image) for flat_image in flat_stack], dtype=float)
+
+# Measure ssa images with the quantification rules. Images of the
+# same size are stacked, so every measurement is done for all images
+# of a snapshot set at once. Returns one row per image, ROI and threshold
+def quantify_images(image_infos, images, rules):
+    rows = []
+    shape_images = {}
+    for image_info, image in zip(image_infos, images):
+        shape_images.setdefault(image.shape, []).append((image_info, image))
+    for shape_image_list in shape_images.values():
+        image_stack = numpy.stack([image for _, image in shape_image_list])
+        flat_stack = image_stack.reshape(len(image_stack), -1)
+        thresholds = [(threshold['name'], threshold_values(flat_stack, threshold))
+                      for threshold in rules['thresholds']] or [(None, None)]
+        for roi in rules['rois']:
+            pixels = roi_pixels(image_stack, roi)
+            pixel_count = pixels.shape[1]
+            minimum = pixels.min(axis=1)
+            maximum = pixels.max(axis=1)
+            integrated_density = pixels.sum(axis=1, dtype=numpy.uint64)
+            for threshold_name, values in thresholds:
+                if values is None:
+                    area = numpy.full(len(pixels), pixel_count)
+                    thresholded_density = integrated_density
+                else:
+                    above = pixels > values[:, numpy.newaxis]
+                    area = above.sum(axis=1)
+                    thresholded_density = numpy.where(above, pixels, 0).sum(axis=1, dtype=numpy.uint64)
+                for image_num, (image_info, _) in enumerate(shape_image_list):
+                    rows.append({
+                        'group': image_info['group'],
+                        'time_point': image_info['time_point'],
+                        'channel': image_info['lctf_channel'] or image_info['channel_name'],
+                        'snapshot_name': image_info['snapshot_name'],
+                        'snapshot_dir': image_info['snapshot_dir'],
+                        'roi': roi['name'],
+                        'threshold': threshold_name,
+                        'threshold_value': None if values is None else float(values[image_num]),
+                        'pixels': pixel_count,
+                        'min': int(minimum[image_num]),
+                        'max': int(maximum[image_num]),
+                        'mean': float(integrated_density[image_num]) / pixel_count,
+                        'integrated_density': int(integrated_density[image_num]),
+                        'area': int(area[image_num]),
+                        'area_fraction': float(area[image_num]) / pixel_count,
+                        'thresholded_integrated_density': int(thresholded_density[image_num]),
+                        'source_file': image_info['source_file']
+                    })
+    return rows
+
+# Rows of the quantification table of a previous run (values as text),
+# an empty list if there is none
+def load_quantification_table(output_dir):
+    table_path = os.path.join(output_dir, quantification_file_name)
+    if not os.path.isfile(table_path):
+        return []
+    with open(table_path, newline='') as table_file:
+        return list(csv.DictReader(table_file))
+
+# Measurements of all files in the manifest. Entries are replaced per source
+# file, so the files that were not selected in a run keep their rows
+def manifest_quantification_rows(manifest):
+    return [row for entry in manifest['files'].values() for row in entry.get('quantification', [])]
+
+# Write the quantification rows as one table, one row per image, ROI and
+# threshold, ordered by group, time point, snapshot and channel
+def save_quantification_table(output_dir, rows):
+    rows = sorted(rows, key=lambda row: (row['group'] or '', row['time_point'], row['snapshot_dir'],
+                                         row['source_file']))
+    table_path = os.path.join(output_dir, quantification_file_name)
+    with open(table_path + '.tmp', 'w', newline='') as table_file:
+        writer = csv.DictWriter(table_file, quantification_columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(table_path + '.tmp', table_path)
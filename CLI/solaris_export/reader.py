@@ -0,0 +1,131 @@
+# Read the raw Solaris image files
+# Read/write files and directories
+import os
+# Numeric Python
+import numpy
+# Read JSON file format
+import json
+# Stage timers
+import time
+from .config import ExportConfig, channels, image_dtypes, infer_image_size
+from .index import build_experiment_index, query_index, record_output_name
+from .stats import add_stage_time
+
+
+# This is the main function to read the image files in a directory
+# With use_memmap the file is mapped instead of copied into memory,
+# the returned image is a view and pixels are only read when it is used.
+# snapshot_metadata can be passed if the metadata file was already read
+# Time spent in each stage is added to stats, if given
+def read_solaris_image_set(directory, file_name, lctf_channel=False, use_memmap=False, snapshot_metadata=None,
+                           stats=None, config=None):
+    if config is None:
+        config = ExportConfig()
+    # Read snapshot metadata
+    if snapshot_metadata is None:
+        start_time = time.perf_counter()
+        if lctf_channel:
+            # LCTF channels store the metadata in the parent directory
+            # The '..' is Unix notation to move up a directory
+            metadata_path = os.path.join(directory, '..', 'metadata.svd')
+        else:
+            metadata_path = os.path.join(directory, 'metadata.svd')
+
+        with open(metadata_path) as metadata_file:
+            snapshot_metadata = json.load(metadata_file)
+        add_stage_time(stats, 'metadata', start_time)
+    # Using the data from the metadata file in the snapshot directory
+    # We can extract extra information about the type of image
+    current_channel_num = str(snapshot_metadata['Channel'])
+    current_channel = channels[current_channel_num]
+    snaphot_name = snapshot_metadata['DataName']
+    
+    # Construct file name of image file
+    current_full_file = os.path.join(directory, file_name)
+    # Find the image file extension
+    field_name = file_name.split('.')[1]
+    
+    # Store all the image information in a single dictionary
+    image_info = {
+        'channel_num': current_channel_num,
+        'channel_name': current_channel,
+        'snapshot_name': snaphot_name,
+        'field_name': field_name
+    }
+    # Print debug information about current file
+    if config.verbose:
+        print('Reading: {}\n\t{}'.format(current_full_file, image_info))
+
+    # Read image file(s) as long as they are not the side-by-side images
+    if field_name != 'ssm':
+        start_time = time.perf_counter()
+        image_dtype = image_dtypes[field_name]
+        # A memory-mapped file is read when its pages are copied,
+        # its bytes are counted there (see tiff.read_image_rows)
+        if use_memmap:
+            byte_array = numpy.memmap(current_full_file, dtype=image_dtype, mode='r')
+            add_stage_time(stats, 'read', start_time)
+        else:
+            byte_array = numpy.fromfile(current_full_file, dtype=image_dtype)
+            add_stage_time(stats, 'read', start_time, byte_array.nbytes)
+        start_time = time.perf_counter()
+
+        # Use the image size given on the command line, or
+        # find it from the length of the byte array
+        if config.image_size:
+            image_size = config.image_size
+        else:
+            image_size = infer_image_size(field_name, byte_array.nbytes)
+            if image_size is None:
+                raise ValueError('{} bytes matches no Solaris image size'.format(byte_array.nbytes))
+
+        # Reconstruct image from array
+        if field_name=='ssr':
+            # Color image (R G B)
+            reconstructed_im = numpy.reshape(byte_array, [image_size, image_size, 3])
+        else:
+            # Monochrome 16-bit image
+            reconstructed_im = numpy.reshape(byte_array, [image_size, image_size])
+            # Flip fluorescent image (up-down)
+            reconstructed_im = numpy.flipud(reconstructed_im)
+            # Rotate image -90 degrees
+            reconstructed_im = numpy.rot90(reconstructed_im,-1)
+        add_stage_time(stats, 'orient', start_time)
+        return [reconstructed_im, image_info]
+
+# Generator over the images of index records (for example of one snapshot directory)
+# Yields (image_info, lazy_image) where lazy_image is a memory-mapped view,
+# so only one image at a time is referenced. Files that cannot be read are
+# appended as (file, error) to errors, or raised if no list is given
+# skip_file is an optional function of the record that returns True
+# for files that should not be read. Stage times are added to stats
+def iter_image_records(file_records, errors=None, skip_file=None, stats=None, config=None):
+    for record in file_records:
+        try:
+            if skip_file is not None and skip_file(record):
+                continue
+            lazy_image, image_info = read_solaris_image_set(os.path.dirname(record['path']), record['file_name'],
+                                                            record['lctf_channel'] is not None, use_memmap=True,
+                                                            snapshot_metadata={'Channel': record['channel_num'],
+                                                                               'DataName': record['snapshot_name']},
+                                                            stats=stats, config=config)
+        except Exception as error:
+            if errors is None:
+                raise
+            errors.append((record['path'], '{}: {}'.format(type(error).__name__, error)))
+            continue
+        for key in ['group', 'time_point', 'snapshot_dir', 'lctf_channel']:
+            image_info[key] = record[key]
+        image_info['source_file'] = record['path']
+        image_info['output_name'] = record_output_name(record)
+        yield image_info, lazy_image
+
+# Streaming API: yield (image_info, lazy_image) for every image of an
+# experiment. Images are memory-mapped, so memory use does not depend
+# on the size of the experiment. The keyword arguments of query_index
+# can be used to select images
+def iter_solaris_images(input_dir, errors=None, index=None, config=None, **query):
+    if index is None:
+        index = build_experiment_index(input_dir, config=config)
+    for image_info, lazy_image in iter_image_records(query_index(index, **query), errors, config=config):
+        yield image_info, lazy_image
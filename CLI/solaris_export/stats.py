@@ -0,0 +1,88 @@
+# Statistics, progress line and report of an export
+# Progress line
+import sys
+# Stage timers
+import time
+
+
+# Stages of the export that are timed
+# - scan: list the experiment directories
+# - metadata: parse the groups.svd and metadata.svd files
+# - manifest: compare the files with the manifest of the previous export
+# - read: read the raw image files. Memory-mapped raw data is read
+#   when it is copied block by block for the output files
+# - orient: reshape, flip and rotate the images
+# - encode: build the TIFF headers and compress the pages (--compress)
+# - write: write the output files
+# - quantify: measure the ssa images (--quantify)
+# - unmix: unmix the LCTF cubes (--unmix)
+# - preview: write the previews and contact sheets
+export_stages = ['scan', 'metadata', 'manifest', 'read', 'orient', 'encode', 'write', 'quantify', 'unmix',
+                 'preview']
+
+# Statistics of an export: exported and skipped files, input bytes,
+# and time (summed over all workers) and bytes of each stage
+def new_export_stats():
+    return {
+        'files': 0,
+        'skipped_files': 0,
+        'bytes': 0,
+        'seconds': dict((stage, 0.0) for stage in export_stages),
+        'stage_bytes': dict((stage, 0) for stage in export_stages)
+    }
+
+# Add the time since start_time to a stage, if statistics are collected
+def add_stage_time(stats, stage, start_time, byte_count=0):
+    if stats is not None:
+        stats['seconds'][stage] += time.perf_counter() - start_time
+        stats['stage_bytes'][stage] += byte_count
+
+# Add the statistics of a job (or a worker) to the total
+def merge_export_stats(total_stats, stats):
+    for key in ['files', 'skipped_files', 'bytes']:
+        total_stats[key] += stats[key]
+    for stage in export_stages:
+        total_stats['seconds'][stage] += stats['seconds'][stage]
+        total_stats['stage_bytes'][stage] += stats['stage_bytes'][stage]
+
+# Format seconds as h:mm:ss
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{:d}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+# Rolling progress line: files done, throughput and estimated time left
+def print_progress(done_files, total_files, done_bytes, total_bytes, start_time):
+    elapsed_seconds = time.perf_counter() - start_time
+    if elapsed_seconds > 0 and done_bytes > 0:
+        bytes_per_second = done_bytes / elapsed_seconds
+        eta = format_seconds((total_bytes - done_bytes) / bytes_per_second)
+    else:
+        bytes_per_second = 0.0
+        eta = '-:--:--'
+    sys.stdout.write('\r{}/{} files  {:.1f} MB/s  ETA {}  '.format(done_files, total_files,
+                                                                  bytes_per_second / 1e6, eta))
+    if done_files == total_files:
+        sys.stdout.write('\n')
+    sys.stdout.flush()
+
+# End of run report with the throughput of every stage
+def export_report(stats, total_seconds, export_errors):
+    report = {
+        'files': stats['files'],
+        'skipped_files': stats['skipped_files'],
+        'errors': len(export_errors),
+        'bytes': stats['bytes'],
+        'seconds': total_seconds,
+        'mb_per_second': stats['bytes'] / 1e6 / total_seconds if total_seconds > 0 else None,
+        'stages': {}
+    }
+    for stage in export_stages:
+        stage_seconds = stats['seconds'][stage]
+        report['stages'][stage] = {
+            'seconds': stage_seconds,
+            'bytes': stats['stage_bytes'][stage],
+            'mb_per_second': stats['stage_bytes'][stage] / 1e6 / stage_seconds
+                             if stage_seconds > 0 and stats['stage_bytes'][stage] else None
+        }
+    return report
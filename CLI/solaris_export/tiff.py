@@ -0,0 +1,267 @@
+# TIFF writers of the exported images
+# Read/write files and directories
+import os
+# Numeric Python
+import numpy
+# Pack the binary fields of the TIFF header
+import struct
+# Checksums of the output files
+import hashlib
+# Deflate compression of the strips, on a pool of threads
+import zlib
+import concurrent.futures
+import threading
+# Byte order of this machine
+import sys
+# Stage timers
+import time
+from .manifest import file_sha256
+from .stats import add_stage_time
+
+
+# TIFF field types: SHORT, LONG, RATIONAL and ASCII
+tiff_field_types = {'H': 3, 'I': 4, 'R': 5, 's': 2}
+
+# Copy rows of an image into memory. The raw files are memory-mapped, so
+# copying the rows of a memory-mapped image reads them from the input
+# directory: the copy is timed as read, apart from the output write
+def read_image_rows(image_rows, stats=None):
+    if not isinstance(image_rows, numpy.memmap):
+        return numpy.ascontiguousarray(image_rows)
+    start_time = time.perf_counter()
+    rows = numpy.array(image_rows, order='C')
+    add_stage_time(stats, 'read', start_time, rows.nbytes)
+    return rows
+
+# Write the pixel data of an image straight from the array buffer.
+# Oriented views (flipped and rotated) are not contiguous, they are
+# written in blocks of rows so only a small buffer is copied at a time
+def write_image_data(data_file, image, stats=None):
+    # TIFF pixel data is little-endian, as declared in the header
+    if image.dtype.byteorder == '>' or (image.dtype.byteorder == '=' and sys.byteorder == 'big'):
+        image = image.astype(image.dtype.newbyteorder('<'))
+    if image.flags['C_CONTIGUOUS'] and not isinstance(image, numpy.memmap):
+        data_file.write(image.data)
+    else:
+        rows_per_block = max(1, (1 << 20) // max(1, image[0].nbytes))
+        for row in range(0, image.shape[0], rows_per_block):
+            data_file.write(read_image_rows(image[row:row + rows_per_block], stats).data)
+
+# Tags of one baseline TIFF page as a sorted list of (tag, type, values)
+# Uncompressed pages are one strip, deflate pages have strips of
+# rows_per_strip rows and use the horizontal differencing predictor
+# for integer images
+def tiff_page_tags(image, strip_offsets, strip_byte_counts, rows_per_strip, description=None, compression=None):
+    samples_per_pixel = image.shape[2] if image.ndim == 3 else 1
+    page_tags = [
+        (256, 'I', [image.shape[1]]),                             # ImageWidth
+        (257, 'I', [image.shape[0]]),                             # ImageLength
+        (258, 'H', [image.dtype.itemsize * 8] * samples_per_pixel),  # BitsPerSample
+        (259, 'H', [8 if compression == 'deflate' else 1]),       # Compression: deflate or none
+        (262, 'H', [2 if samples_per_pixel == 3 else 1]),         # Photometric: RGB or BlackIsZero
+        (273, 'I', strip_offsets),                                # StripOffsets
+        (277, 'H', [samples_per_pixel]),                          # SamplesPerPixel
+        (278, 'I', [rows_per_strip]),                             # RowsPerStrip
+        (279, 'I', strip_byte_counts),                            # StripByteCounts
+        (282, 'R', [1, 1]),                                       # XResolution
+        (283, 'R', [1, 1]),                                       # YResolution
+        (284, 'H', [1]),                                          # PlanarConfiguration: chunky
+        (296, 'H', [1])                                           # ResolutionUnit: none
+    ]
+    if compression == 'deflate' and image.dtype.kind in 'ui':
+        page_tags.append((317, 'H', [2]))                        # Predictor: horizontal differencing
+    if image.dtype.kind == 'f':
+        page_tags.append((339, 'H', [3] * samples_per_pixel))    # SampleFormat: floating point
+    if description is not None:
+        page_tags.append((270, 's', description.encode('ascii', 'replace') + b'\x00'))  # ImageDescription
+    return sorted(page_tags)
+
+# Encode an image file directory (IFD) at ifd_offset. Values that do
+# not fit in the 4 byte entry are stored right after the directory
+def encode_tiff_ifd(page_tags, ifd_offset, next_ifd_offset):
+    extra_offset = ifd_offset + 2 + 12 * len(page_tags) + 4
+    entries = [struct.pack('<H', len(page_tags))]
+    extra_data = []
+    for tag, field_type, values in page_tags:
+        if field_type == 's':
+            value_bytes = bytes(values)
+            count = len(value_bytes)
+        elif field_type == 'R':
+            value_bytes = struct.pack('<{}I'.format(len(values)), *values)
+            count = len(values) // 2
+        else:
+            value_bytes = struct.pack('<{}{}'.format(len(values), field_type), *values)
+            count = len(values)
+        if len(value_bytes) <= 4:
+            entries.append(struct.pack('<HHI', tag, tiff_field_types[field_type], count) + value_bytes.ljust(4, b'\x00'))
+        else:
+            entries.append(struct.pack('<HHII', tag, tiff_field_types[field_type], count, extra_offset))
+            # Values start on a word boundary
+            value_bytes += b'\x00' * (len(value_bytes) % 2)
+            extra_data.append(value_bytes)
+            extra_offset += len(value_bytes)
+    entries.append(struct.pack('<I', next_ifd_offset))
+    return b''.join(entries + extra_data)
+
+# Size of the compressed strips before compression. Strips are compressed
+# in parallel, so a page is split into several strips
+compression_strip_bytes = 1 << 17
+# Threads that compress the strips by default, zlib releases the GIL while it compresses
+compression_threads = os.cpu_count() or 1
+# Pool of compression threads of this process, started when it is first used.
+# A worker process started by fork inherits the pool of its parent but not
+# its threads, so a pool is only used by the process that started it
+compression_executor = None
+compression_executor_pid = None
+compression_executor_threads = None
+compression_executor_lock = threading.Lock()
+
+def get_compression_executor(threads=None):
+    global compression_executor, compression_executor_pid, compression_executor_threads
+    threads = threads or compression_threads
+    with compression_executor_lock:
+        if compression_executor_pid != os.getpid() or compression_executor_threads != threads:
+            if compression_executor_pid == os.getpid():
+                compression_executor.shutdown(wait=False)
+            compression_executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+            compression_executor_pid = os.getpid()
+            compression_executor_threads = threads
+        return compression_executor
+
+# Rows of a deflate strip of an image
+def compression_rows_per_strip(image):
+    return max(1, min(image.shape[0], compression_strip_bytes // max(1, image[0].nbytes)))
+
+# Compress rows of an image as one deflate strip. Integer samples are
+# replaced by the difference to the sample on their left (the TIFF horizontal
+# predictor), which makes smooth images compress much better
+def compress_strip(image_rows, compression_level):
+    strip = numpy.ascontiguousarray(image_rows, dtype=image_rows.dtype.newbyteorder('<'))
+    if strip.dtype.kind in 'ui':
+        differences = strip.copy()
+        differences[:, 1:] -= strip[:, :-1]
+        strip = differences
+    return zlib.compress(strip.data, compression_level)
+
+# Compress the pages of a file on the compression threads. The strips are
+# read on this thread while the threads compress the strips read before
+# Returns the list of compressed strips of every page
+def compress_pages(pages, compression_level, stats=None, compression_threads=None):
+    executor = get_compression_executor(compression_threads)
+    page_futures = []
+    for page in pages:
+        rows_per_strip = compression_rows_per_strip(page)
+        page_futures.append([executor.submit(compress_strip,
+                                             read_image_rows(page[row:row + rows_per_strip], stats),
+                                             compression_level)
+                             for row in range(0, page.shape[0], rows_per_strip)])
+    return [[future.result() for future in futures] for futures in page_futures]
+
+# Output file that computes the SHA-256 checksum of the bytes written to it,
+# so the checksum of a file does not need another read
+class ChecksumFile(object):
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.data_file.write(data)
+
+# Lean baseline TIFF writer for uint8 RGB, uint16 monochrome and float32 images.
+# The layout of all pages is computed first, so the file is written
+# front to back without seeking (pages: [IFD, tag values, pixel data])
+# With compression='deflate' the pages are compressed losslessly first,
+# on compression_threads threads (None for all processor cores).
+# Memory-mapped pages are read while they are compressed or written, that
+# time is moved from the encode and write stages to read.
+# Returns the SHA-256 checksum of the file
+def write_tiff_native(output_path, pages, page_descriptions=None, stats=None, compression=None,
+                      compression_level=1, compression_threads=None):
+    if stats is not None:
+        read_seconds = stats['seconds']['read']
+    start_time = time.perf_counter()
+    if page_descriptions is None:
+        page_descriptions = [None] * len(pages)
+    if compression == 'deflate':
+        page_strips = compress_pages(pages, compression_level, stats, compression_threads)
+    elif compression is None:
+        page_strips = [None] * len(pages)
+    else:
+        raise ValueError('Unknown compression: {}'.format(compression))
+    page_ifds = []
+    ifd_offset = 8
+    for page, description, strips in zip(pages, page_descriptions, page_strips):
+        if strips is None:
+            rows_per_strip = page.shape[0]
+            strip_byte_counts = [page.nbytes]
+        else:
+            rows_per_strip = compression_rows_per_strip(page)
+            strip_byte_counts = [len(strip) for strip in strips]
+        # The size of the directory does not depend on the offsets
+        ifd_size = len(encode_tiff_ifd(tiff_page_tags(page, [0] * len(strip_byte_counts), strip_byte_counts,
+                                                      rows_per_strip, description, compression), 0, 0))
+        strip_offsets = []
+        next_ifd_offset = ifd_offset + ifd_size
+        for strip_byte_count in strip_byte_counts:
+            strip_offsets.append(next_ifd_offset)
+            next_ifd_offset += strip_byte_count
+        # Directories start on a word boundary
+        next_ifd_offset += next_ifd_offset % 2
+        page_ifds.append(encode_tiff_ifd(tiff_page_tags(page, strip_offsets, strip_byte_counts, rows_per_strip,
+                                                        description, compression), ifd_offset,
+                                         next_ifd_offset if len(page_ifds) < len(pages) - 1 else 0))
+        ifd_offset = next_ifd_offset
+    add_stage_time(stats, 'encode', start_time, sum(page.nbytes for page in pages) if compression else 0)
+    if stats is not None:
+        stats['seconds']['encode'] -= stats['seconds']['read'] - read_seconds
+        read_seconds = stats['seconds']['read']
+    start_time = time.perf_counter()
+    with open(output_path, 'wb') as tiff_file:
+        checksum_file = ChecksumFile(tiff_file)
+        # Little-endian TIFF header with the offset of the first directory
+        checksum_file.write(b'II*\x00' + struct.pack('<I', 8))
+        for page, page_ifd, strips in zip(pages, page_ifds, page_strips):
+            checksum_file.write(page_ifd)
+            if strips is None:
+                write_image_data(checksum_file, page, stats)
+                data_size = page.nbytes
+            else:
+                for strip in strips:
+                    checksum_file.write(strip)
+                data_size = sum(len(strip) for strip in strips)
+            if data_size % 2:
+                checksum_file.write(b'\x00')
+    add_stage_time(stats, 'write', start_time, sum(page.nbytes for page in pages))
+    if stats is not None:
+        stats['seconds']['write'] -= stats['seconds']['read'] - read_seconds
+    return checksum_file.digest.hexdigest()
+
+# Writer using skimage, multiple pages are written as one stack
+# The pages are read into memory first, then skimage encodes and writes
+# in one call, both are timed as write
+# skimage is only imported when it is used, it takes longer to import than the
+# rest of the export. Returns the SHA-256 checksum of the file
+def write_tiff_skimage(output_path, pages, page_descriptions=None, stats=None, compression=None,
+                       compression_level=1, compression_threads=None):
+    if compression is not None:
+        raise ValueError('The skimage writer does not compress, use the native writer')
+    from skimage import io
+    pages = [read_image_rows(page, stats) for page in pages]
+    start_time = time.perf_counter()
+    if len(pages) == 1:
+        io.imsave(output_path, pages[0])
+    else:
+        io.imsave(output_path, numpy.stack(pages))
+    checksum = file_sha256(output_path)
+    add_stage_time(stats, 'write', start_time, sum(page.nbytes for page in pages))
+    return checksum
+
+# Output images are written by one of the image_writers. A writer takes the
+# output path, a list of pages (one image for a single page TIFF),
+# optional page descriptions, optional statistics, the compression and the
+# compression threads, and returns the SHA-256 checksum of the file
+image_writers = {
+    'native': write_tiff_native,
+    'skimage': write_tiff_skimage
+}
@@ -0,0 +1,75 @@
+# Spectral unmixing of the LCTF cubes
+# Numeric Python
+import numpy
+# Read JSON file format
+import json
+from .config import lctf_bands
+
+
+# NNLS tries every subset of the endmembers, so their number is limited
+max_nnls_endmembers = 6
+
+# Read and check the endmember spectra of the unmixing, for example:
+# {
+#   "method": "nnls",
+#   "bands": ["520", "530", "540", "550", "560", "570", "580", "590", "600", "610", "620"],
+#   "endmembers": [{"name": "Tumor", "spectrum": [one value per band]},
+#                  {"name": "Autofluorescence", "spectrum": [one value per band]}]
+# }
+# method is nnls (non-negative least squares, default) or lstsq (least squares)
+# bands is optional, by default all 11 bands are used
+# Raises ValueError if the spectra are not valid
+def load_unmixing_spectra(spectra_file):
+    with open(spectra_file) as data_file:
+        spectra = json.load(data_file)
+    method = spectra.get('method', 'nnls')
+    if method not in ('nnls', 'lstsq'):
+        raise ValueError('method must be nnls or lstsq, not {}'.format(method))
+    bands = [str(band) for band in spectra.get('bands', lctf_bands)]
+    for band in bands:
+        if band not in lctf_bands:
+            raise ValueError('{} is not an LCTF band: {}'.format(band, ', '.join(lctf_bands)))
+    names = []
+    endmember_spectra = []
+    for endmember in spectra.get('endmembers', []):
+        if 'name' not in endmember or len(endmember.get('spectrum', [])) != len(bands):
+            raise ValueError('every endmember needs a name and a spectrum with {} values'.format(len(bands)))
+        names.append(str(endmember['name']))
+        endmember_spectra.append([float(value) for value in endmember['spectrum']])
+    if not names:
+        raise ValueError('no endmembers')
+    if method == 'nnls' and len(names) > max_nnls_endmembers:
+        raise ValueError('nnls takes at most {} endmembers'.format(max_nnls_endmembers))
+    return {'method': method, 'bands': bands, 'names': names, 'spectra': endmember_spectra}
+
+# Unmix a cube (bands, rows, columns) into abundance maps (endmembers, rows, columns)
+# All pixels are solved at once from the normal equations: with the endmember
+# spectra S (bands x endmembers) and the pixel spectra Y, the least squares
+# abundances are (S'S)^-1 S'Y. NNLS is solved exactly by trying every subset of
+# endmembers: the solution is the least squares solution of the subset that
+# has no negative abundances and the smallest residual. The residual is reduced
+# by a'S'Y, so only S'Y (endmembers x pixels) is needed, not the cube itself.
+# Pixels whose least squares solution has no negative abundances are already solved
+def unmix_cube(cube, unmixing):
+    spectra = numpy.array(unmixing['spectra'], dtype=numpy.float64).T
+    gram = spectra.T.dot(spectra)
+    flat_cube = cube.reshape(len(cube), -1)
+    correlations = spectra.T.astype(numpy.float32).dot(flat_cube.astype(numpy.float32)).astype(numpy.float64)
+    abundances = numpy.linalg.pinv(gram).dot(correlations)
+    if unmixing['method'] == 'nnls':
+        unsolved = numpy.flatnonzero((abundances < 0).any(axis=0))
+        unsolved_correlations = correlations[:, unsolved]
+        endmember_count = len(unmixing['names'])
+        unsolved_abundances = numpy.zeros_like(unsolved_correlations)
+        # All abundances zero is always a solution, with no reduction of the residual
+        best_fit = numpy.zeros(len(unsolved))
+        for subset_bits in range(1, 2 ** endmember_count - 1):
+            subset = [endmember for endmember in range(endmember_count) if subset_bits >> endmember & 1]
+            subset_abundances = numpy.linalg.pinv(gram[numpy.ix_(subset, subset)]).dot(unsolved_correlations[subset])
+            fit = (subset_abundances * unsolved_correlations[subset]).sum(axis=0)
+            better = numpy.flatnonzero((subset_abundances >= 0).all(axis=0) & (fit > best_fit))
+            unsolved_abundances[:, better] = 0
+            unsolved_abundances[numpy.ix_(subset, better)] = subset_abundances[:, better]
+            best_fit[better] = fit[better]
+        abundances[:, unsolved] = unsolved_abundances
+    return abundances.reshape((len(abundances),) + cube.shape[1:]).astype(numpy.float32)
@@ -0,0 +1,174 @@
+# Export the snapshots of an experiment while it is acquired
+# Read/write files and directories
+import os
+# Poll interval and time stamps
+import time
+from .config import ExportConfig, infer_image_size, lctf_bands
+from .export import create_export_executor, expand_stack_records, export_experiment
+from .index import build_experiment_index, index_errors, index_file_name, query_index, save_experiment_index
+from .manifest import prune_export_manifest, save_export_manifest, save_output_checksums
+from .previews import write_index_contact_sheets
+from .quantify import manifest_quantification_rows, save_quantification_table
+from .stats import add_stage_time, export_report, format_seconds, new_export_stats
+
+
+# Index records of the snapshots with image files that are not in the
+# manifest or changed since they were exported, by snapshot
+def pending_snapshots(file_records, manifest):
+    snapshots = {}
+    for record in file_records:
+        snapshot_key = (record['group'], record['time_point'], record['snapshot_dir'])
+        snapshots.setdefault(snapshot_key, []).append(record)
+    pending = {}
+    for snapshot_key, snapshot_records in snapshots.items():
+        for record in snapshot_records:
+            entry = manifest['files'].get(record['path'])
+            if entry is None or entry['size'] != record['size'] or entry['mtime_ns'] != record['mtime_ns']:
+                pending[snapshot_key] = snapshot_records
+                break
+    return pending
+
+# Size and modification time of the metadata and image files of a snapshot.
+# The files are checked again on every call, as a file that is still being
+# written does not change the modification time of its directory.
+# Returns None if a file was removed
+def snapshot_signature(snapshot_records):
+    file_paths = set([snapshot_records[0]['metadata_file']])
+    file_paths.update(record['path'] for record in snapshot_records)
+    signature = []
+    try:
+        for file_path in sorted(file_paths):
+            file_stat = os.stat(file_path)
+            signature.append((file_path, file_stat.st_size, file_stat.st_mtime_ns))
+    except OSError:
+        return None
+    return tuple(signature)
+
+# LCTF bands of the Unmixed snapshots that have an ssa image, by snapshot.
+# The Solaris writes the band directories of an Unmixed snapshot one after
+# the other, so the bands are taken from all records of the index (not only
+# the records selected with --channel or --field)
+def snapshot_lctf_bands(file_records):
+    snapshot_bands = {}
+    for record in file_records:
+        if record['lctf_channel'] is not None:
+            snapshot_key = (record['group'], record['time_point'], record['snapshot_dir'])
+            bands = snapshot_bands.setdefault(snapshot_key, set())
+            if record['field_name'] == 'ssa' and record['lctf_channel'] in lctf_bands:
+                bands.add(record['lctf_channel'])
+    return snapshot_bands
+
+# Seconds a snapshot with a file that matches no valid Solaris geometry
+# must be unchanged before it is exported (and the file reported as an error)
+# with --watch, as the file may still be being written
+watch_incomplete_seconds = 60.0
+# Seconds an Unmixed snapshot without all LCTF bands must be unchanged before
+# it is exported. The bands are acquired one after the other, which takes
+# longer than writing a file
+watch_missing_bands_seconds = 300.0
+
+# Watch an experiment and export every snapshot once it is complete,
+# until stopped with Ctrl+C. The index is updated on every poll, so only
+# the time points that changed are listed again. A snapshot is complete once
+# its metadata.svd and image files did not change for one poll interval,
+# every image file has a valid size and an Unmixed snapshot has all
+# LCTF bands. A snapshot whose metadata.svd cannot be read yet is indexed
+# again on every poll, and reported if it still cannot be read after
+# watch_incomplete_seconds. With quantification_rules the
+# quantification table is written again after every export, with the
+# measurements of all snapshots exported so far.
+# The workers and the imported modules are kept between exports
+def watch_experiment(input_dir, output_dir, index, manifest, query=None, interval=5.0, workers=1,
+                     pool_type='process', use_hash=False, progress=False, quantification_rules=None, config=None):
+    if config is None:
+        config = ExportConfig()
+    query = query or {}
+    index_path = os.path.join(output_dir, index_file_name)
+    executor = None
+    if workers > 1:
+        executor = create_export_executor(workers, pool_type)
+    # Signatures of the pending snapshots in the previous poll, with the
+    # time they were first seen, and of the snapshots that were already exported
+    previous_signatures = {}
+    exported_signatures = {}
+    # Time each index error was first seen, and the errors that were reported
+    error_times = {}
+    reported_errors = set()
+    print('Watching {} every {:g} s, press Ctrl+C to stop'.format(input_dir, interval))
+    try:
+        while True:
+            poll_time = time.time()
+            index = build_experiment_index(input_dir, index, config=config)
+            signatures = {}
+            ready_records = []
+            snapshot_bands = snapshot_lctf_bands(query_index(index))
+            for snapshot_key, snapshot_records in pending_snapshots(query_index(index, **query), manifest).items():
+                signature = snapshot_signature(snapshot_records)
+                if signature is None or exported_signatures.get(snapshot_key) == signature:
+                    continue
+                previous_signature, first_seen = previous_signatures.get(snapshot_key, (None, poll_time))
+                if previous_signature != signature:
+                    signatures[snapshot_key] = (signature, poll_time)
+                    continue
+                file_sizes = dict((file_path, byte_size) for file_path, byte_size, _ in signature)
+                sizes_valid = True
+                for record in snapshot_records:
+                    image_size = infer_image_size(record['field_name'], file_sizes[record['path']])
+                    if image_size is None or (config.image_size and image_size != config.image_size):
+                        sizes_valid = False
+                unchanged_seconds = poll_time - first_seen
+                if len(snapshot_bands.get(snapshot_key, lctf_bands)) < len(lctf_bands):
+                    ready = unchanged_seconds >= watch_missing_bands_seconds
+                else:
+                    ready = sizes_valid or unchanged_seconds >= watch_incomplete_seconds
+                if ready:
+                    ready_records.extend(snapshot_records)
+                    exported_signatures[snapshot_key] = signature
+                else:
+                    signatures[snapshot_key] = (signature, first_seen)
+            previous_signatures = signatures
+            current_errors = dict(index_errors(index))
+            error_times = dict((error_path, error_times.get(error_path, poll_time)) for error_path in current_errors)
+            reported_errors &= set(current_errors)
+            for error_path, first_seen in sorted(error_times.items()):
+                if poll_time - first_seen >= watch_incomplete_seconds and error_path not in reported_errors:
+                    print('{} Cannot index\n\t{}\n\t\t{}'.format(time.strftime('%H:%M:%S'), error_path,
+                                                                 current_errors[error_path]))
+                    reported_errors.add(error_path)
+
+            if ready_records:
+                # Stacks and cubes are written with all their pages
+                ready_records = expand_stack_records(ready_records, query_index(index), config)
+                export_stats = new_export_stats()
+                start_time = time.perf_counter()
+                quantification = None
+                if quantification_rules is not None:
+                    quantification = {'rules': quantification_rules, 'rows': []}
+                _, export_errors = export_experiment(ready_records, output_dir, workers, pool_type,
+                                                     keep_images=False, manifest=manifest, use_hash=use_hash,
+                                                     stats=export_stats, progress=progress, executor=executor,
+                                                     quantification=quantification, config=config)
+                if config.write_previews:
+                    # The contact sheets of the time points get the new snapshots
+                    preview_start_time = time.perf_counter()
+                    write_index_contact_sheets(output_dir, index, ready_records)
+                    add_stage_time(export_stats, 'preview', preview_start_time)
+                prune_export_manifest(manifest, query_index(index))
+                save_export_manifest(output_dir, manifest)
+                save_output_checksums(output_dir, manifest)
+                if quantification is not None:
+                    save_quantification_table(output_dir, manifest_quantification_rows(manifest))
+                save_experiment_index(index, index_path)
+                report = export_report(export_stats, time.perf_counter() - start_time, export_errors)
+                print('{} Exported {} file(s), {:.1f} MB in {} ({} skipped, {} error(s))'.format(
+                    time.strftime('%H:%M:%S'), report['files'], report['bytes'] / 1e6,
+                    format_seconds(report['seconds']), report['skipped_files'], report['errors']))
+                for error_file, error_message in export_errors:
+                    print('\t{}\n\t\t{}'.format(error_file, error_message))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print('Stopped watching {}'.format(input_dir))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        save_experiment_index(index, index_path)
@@ -0,0 +1,106 @@
+# Generate a synthetic Solaris experiment directory for testing and benchmarks
+# Read/write files and directories
+import os
+# Read command line arguments
+import argparse
+# Numeric Python
+import numpy
+# Write JSON file format
+import json
+
+# Emission channels of the LCTF used in 'Unmixed' snapshots
+LCTF_channels = ['520', '530', '540', '550', '560', '570', '580', '590', '600', '610', '620',
+                 'Target', 'Tissue', 'Food']
+
+# Write one snapshot directory with a metadata file and ssa, ssr and ssm images
+# For LCTF snapshots the images are written in one sub-directory per emission channel
+def make_snapshot(snapshot_dir, data_name, channel, image_size, lctf_channels, random_state):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, 'metadata.svd'), 'w') as metadata_file:
+        json.dump({'Channel': channel, 'DataName': data_name}, metadata_file)
+    if lctf_channels:
+        image_dirs = [os.path.join(snapshot_dir, lctf_channel) for lctf_channel in lctf_channels]
+    else:
+        image_dirs = [snapshot_dir]
+    for image_dir in image_dirs:
+        os.makedirs(image_dir, exist_ok=True)
+        # 16-bit monochrome fluorescent image
+        random_state.randint(0, 65536, image_size * image_size).astype('uint16').tofile(
+            os.path.join(image_dir, 'Snapshot.ssa'))
+        # 8-bit color image (R G B)
+        random_state.randint(0, 256, image_size * image_size * 3).astype('uint8').tofile(
+            os.path.join(image_dir, 'Snapshot.ssr'))
+        # Side-by-side image, ssr and ssa next to each other
+        numpy.zeros(image_size * image_size * 2, dtype='uint16').tofile(
+            os.path.join(image_dir, 'Snapshot.ssm'))
+
+# Build an experiment with the same layout as the Solaris:
+#   <experiment>/groups.svd (only if groups > 0)
+#   <experiment>/<time point>/<Snapshot n>/metadata.svd, Snapshot.ssa, .ssr, .ssm
+#   <experiment>/<time point>/<Snapshot n Unmixed>/<LCTF channel>/Snapshot.ssa, ...
+# Every group has its own time points. Image sizes are used in turn, so a list
+# such as [1024, 256] gives an experiment with mixed sizes
+# Returns the number of image files and bytes written
+def make_synthetic_experiment(experiment_dir, groups=1, timepoints=2, snapshots=2, unmixed_snapshots=1,
+                              lctf_channels=LCTF_channels, image_sizes=(256,), seed=0):
+    random_state = numpy.random.RandomState(seed)
+    os.makedirs(experiment_dir, exist_ok=True)
+    study_data = []
+    size_num = 0
+    for group_num in range(max(groups, 1)):
+        subject_names = ['Group {} Mouse {}'.format(group_num + 1, timepoint_num + 1)
+                         for timepoint_num in range(timepoints)]
+        study_data.append({'Name': 'Group {}'.format(group_num + 1), 'SubjectNames': subject_names})
+        for time_point in subject_names:
+            for snapshot_num in range(snapshots + unmixed_snapshots):
+                image_size = image_sizes[size_num % len(image_sizes)]
+                size_num += 1
+                if snapshot_num < snapshots:
+                    snapshot_dir = 'Snapshot {}'.format(snapshot_num + 1)
+                    snapshot_lctf_channels = None
+                else:
+                    snapshot_dir = 'Snapshot {} Unmixed'.format(snapshot_num + 1)
+                    snapshot_lctf_channels = lctf_channels
+                # Channel 4 is the 800 nm channel
+                make_snapshot(os.path.join(experiment_dir, time_point, snapshot_dir),
+                              '{} {}'.format(time_point, snapshot_dir), 4, image_size,
+                              snapshot_lctf_channels, random_state)
+    if groups > 0:
+        with open(os.path.join(experiment_dir, 'groups.svd'), 'w') as groups_file:
+            json.dump(study_data, groups_file)
+
+    # Count the images that will be exported (side-by-side images are not)
+    image_files = 0
+    image_bytes = 0
+    for directory, _, file_names in os.walk(experiment_dir):
+        for file_name in file_names:
+            if file_name.endswith('.ssa') or file_name.endswith('.ssr'):
+                image_files += 1
+                image_bytes += os.path.getsize(os.path.join(directory, file_name))
+    return image_files, image_bytes
+
+
+# ********************** MAIN function ********************** #
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic Solaris experiment.')
+    parser.add_argument('experiment_dir', type=str,
+        help='The directory of the new experiment (in quotes if spaces)')
+    parser.add_argument('--groups', dest='groups', type=int, default=1,
+        help='Number of groups, 0 to write no groups.svd. Default: 1')
+    parser.add_argument('--timepoints', dest='timepoints', type=int, default=2,
+        help='Number of time points per group. Default: 2')
+    parser.add_argument('--snapshots', dest='snapshots', type=int, default=2,
+        help='Number of snapshots per time point. Default: 2')
+    parser.add_argument('--unmixed', dest='unmixed_snapshots', type=int, default=1,
+        help='Number of Unmixed (LCTF) snapshots per time point. Default: 1')
+    parser.add_argument('--size', dest='image_sizes', type=int, nargs='+', default=[256],
+        help='Image size(s), used in turn for each snapshot. Default: 256')
+    parser.add_argument('--seed', dest='seed', type=int, default=0,
+        help='Random seed of the pixel data. Default: 0')
+    args = parser.parse_args()
+
+    image_files, image_bytes = make_synthetic_experiment(args.experiment_dir, args.groups, args.timepoints,
+                                                         args.snapshots, args.unmixed_snapshots,
+                                                         image_sizes=args.image_sizes, seed=args.seed)
+    print('Wrote {} image file(s), {:.1f} MB to {}'.format(image_files, image_bytes / 1e6, args.experiment_dir))